@@ -0,0 +1,30 @@
+"""
+Model setup and timing shared by the benchmark scripts.
+"""
+import time
+
+import torch
+
+from model.Denoiser import Denoiser
+from model.Diffusion import Diffusion
+
+
+def timed(fn, repeats):
+    # Seconds per call, after one untimed warm-up call
+    fn()
+    start = time.perf_counter()
+    for _ in range(repeats):
+        fn()
+    return (time.perf_counter() - start) / repeats
+
+
+def build_denoiser(hidden_dim=256, n_layers=8, steps=1000, **kwargs):
+    # Seeded, so every script and process gets the same weights for the same sizes
+    torch.manual_seed(0)
+    return Denoiser((28, 28, 1), hidden_dims=[hidden_dim] * n_layers, diffusion_time_embedding_dim=hidden_dim,
+                    n_times=steps, **kwargs).eval()
+
+
+def build(hidden_dim=256, n_layers=8, steps=1000, device='cpu', **diffusion_kwargs):
+    model = build_denoiser(hidden_dim, n_layers, steps).to(device)
+    return Diffusion(model, n_times=steps, device=device, **diffusion_kwargs)
@@ -0,0 +1,62 @@
+"""
+Eager `Diffusion.sample` against `CompiledSampler` per batch-size bucket, plus the cost of
+the first compiled call with and without the saved compile cache.
+
+    python -m benchmarks.compiled_sampling --buckets 1 8 32 --steps 100
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+from benchmarks.common import build, timed
+from model.CompiledSampler import CompiledSampler
+
+
+def cold_start(args, cache_path):
+    # Time of the first compiled call in a fresh process
+    diffusion = build(args.hidden_dim, args.n_layers, args.steps)
+    start = time.perf_counter()
+    sampler = CompiledSampler(diffusion, buckets=args.buckets[:1], cache_path=cache_path)
+    sampler.sample(args.buckets[0])
+    print(time.perf_counter() - start)
+    if cache_path is not None and not os.path.exists(cache_path):
+        sampler.save_cache()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--buckets', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--steps', type=int, default=100)
+    parser.add_argument('--hidden-dim', type=int, default=256)
+    parser.add_argument('--n-layers', type=int, default=8)
+    parser.add_argument('--repeats', type=int, default=3)
+    parser.add_argument('--cache-path', default='/tmp/compiled_sampling_cache.bin')
+    parser.add_argument('--cold-start', choices=['cache', 'nocache'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.cold_start is not None:
+        return cold_start(args, args.cache_path if args.cold_start == 'cache' else None)
+
+    diffusion = build(args.hidden_dim, args.n_layers, args.steps)
+    compiled = CompiledSampler(diffusion, buckets=args.buckets)
+    print(f"{'batch':>5} {'eager steps/s':>14} {'compiled steps/s':>17} {'speedup':>8}")
+    for N in args.buckets:
+        eager = timed(lambda: diffusion.sample(N, seed=0), args.repeats)
+        fast = timed(lambda: compiled.sample(N, seed=0), args.repeats)
+        print(f"{N:>5} {args.steps / eager:>14.1f} {args.steps / fast:>17.1f} {eager / fast:>8.2f}")
+
+    if os.path.exists(args.cache_path):
+        os.remove(args.cache_path)
+    cmd = [sys.executable, '-m', 'benchmarks.compiled_sampling', '--steps', str(args.steps),
+           '--hidden-dim', str(args.hidden_dim), '--n-layers', str(args.n_layers), '--cache-path', args.cache_path,
+           '--buckets', str(args.buckets[0])]
+    env = dict(os.environ, TORCHINDUCTOR_FX_GRAPH_CACHE='0')
+    for label, mode in (('no cache', 'nocache'), ('populate', 'cache'), ('warm cache', 'cache')):
+        seconds = float(subprocess.run(cmd + ['--cold-start', mode], check=True, capture_output=True, text=True,
+                                       env=env if mode == 'nocache' else None).stdout.split()[-1])
+        print(f"first compiled call, {label}: {seconds:.2f}s")
+
+
+if __name__ == '__main__':
+    main()
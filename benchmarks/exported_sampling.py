@@ -0,0 +1,75 @@
+"""
+Eager `Diffusion` against the frozen TorchScript artifact from `model.export`: time from a fresh
+interpreter to the first reverse step, and steady-state time per reverse step.
+
+    python -m benchmarks.exported_sampling --batch-sizes 1 8 32 --steps 100
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+import torch
+
+from benchmarks.common import build, timed
+from model.checkpoint import save_diffusion
+from model.export import export_step
+from serving.exported_runtime import ExportedSampler
+
+COLD_START = {
+    'eager': ("from model.checkpoint import load_diffusion\n"
+              "d = load_diffusion({path!r})\n"
+              "d.denoise_at_t(torch.randn(1, d.img_C, d.img_H, d.img_W), torch.zeros(1, dtype=torch.long), t=0)\n"),
+    'exported': ("from serving.exported_runtime import ExportedSampler\n"
+                 "s = ExportedSampler({path!r})\n"
+                 "with torch.inference_mode():\n"
+                 "    s.step(torch.randn(1, s.img_C, s.img_H, s.img_W), torch.zeros(1, dtype=torch.long),\n"
+                 "           torch.zeros(1, s.img_C, s.img_H, s.img_W))\n"),
+}
+
+
+def cold_start(kind, path):
+    # Import, load and one reverse step in a fresh interpreter
+    code = "import time\nstart = time.perf_counter()\nimport torch\n" + COLD_START[kind].format(path=path) + \
+           "print(time.perf_counter() - start)\n"
+    result = subprocess.run([sys.executable, '-W', 'ignore', '-c', code], check=True, capture_output=True, text=True)
+    return float(result.stdout.split()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--steps', type=int, default=100)
+    parser.add_argument('--hidden-dim', type=int, default=256)
+    parser.add_argument('--n-layers', type=int, default=8)
+    parser.add_argument('--repeats', type=int, default=20)
+    parser.add_argument('--dir', default='/tmp')
+    args = parser.parse_args()
+
+    diffusion = build(args.hidden_dim, args.n_layers, args.steps)
+    checkpoint_path = os.path.join(args.dir, 'exported_sampling.ckpt')
+    artifact_path = os.path.join(args.dir, 'exported_sampling.ts')
+    save_diffusion(checkpoint_path, diffusion)
+    start = time.perf_counter()
+    export_step(diffusion, artifact_path)
+    print(f"export with parity check: {time.perf_counter() - start:.2f}s")
+    for kind, path in (('eager', checkpoint_path), ('exported', artifact_path)):
+        print(f"first step, {kind}: {cold_start(kind, path):.2f}s")
+
+    frozen = ExportedSampler(artifact_path)
+    optimized = ExportedSampler(artifact_path, optimize=True)
+    print(f"{'batch':>5} {'eager ms/step':>14} {'frozen ms/step':>15} {'optimized ms/step':>18}")
+    with torch.inference_mode():
+        for N in args.batch_sizes:
+            x_t = torch.randn(N, 1, 28, 28)
+            z = torch.randn_like(x_t)
+            timestep = torch.full((N,), args.steps // 2)
+            eager = timed(lambda: diffusion.denoise_at_t(x_t, timestep, t=args.steps // 2), args.repeats)
+            fast = timed(lambda: frozen.step(x_t, timestep, z), args.repeats)
+            fastest = timed(lambda: optimized.step(x_t, timestep, z), args.repeats)
+            print(f"{N:>5} {eager * 1e3:>14.2f} {fast * 1e3:>15.2f} {fastest * 1e3:>18.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+"""
+`Denoiser` against `FoldedDenoiser` (time embedding folded into per-layer bias tables): time per
+call with a shared and with a mixed timestep per batch, and the size of the tables.
+
+    python -m benchmarks.folded_time_embedding --batch-sizes 1 8 32
+"""
+import argparse
+import time
+
+import torch
+
+from benchmarks.common import build_denoiser, timed
+from model.FoldedDenoiser import FoldedDenoiser
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--hidden-dim', type=int, default=256)
+    parser.add_argument('--n-layers', type=int, default=8)
+    parser.add_argument('--n-timesteps', type=int, default=1000)
+    parser.add_argument('--repeats', type=int, default=10)
+    args = parser.parse_args()
+
+    model = build_denoiser(args.hidden_dim, args.n_layers, args.n_timesteps)
+    start = time.perf_counter()
+    folded = FoldedDenoiser(model)
+    table_mb = sum(buffer.numel() * buffer.element_size() for buffer in folded.buffers()) / 2 ** 20
+    print(f"built and checked in {time.perf_counter() - start:.2f}s, tables {table_mb:.1f} MB")
+    print(f"{'batch':>5} {'timesteps':>9} {'eager ms':>9} {'folded ms':>10} {'speedup':>8}")
+    with torch.inference_mode():
+        for N in args.batch_sizes:
+            x = torch.randn(N, 1, 28, 28)
+            for label, timestep in (('shared', torch.full((N,), args.n_timesteps // 2)),
+                                    ('mixed', torch.randint(0, args.n_timesteps, (N,)))):
+                eager = timed(lambda: model(x, timestep), args.repeats)
+                fast = timed(lambda: folded(x, timestep), args.repeats)
+                print(f"{N:>5} {label:>9} {eager * 1e3:>9.1f} {fast * 1e3:>10.1f} {eager / fast:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,38 @@
+"""
+Reference `ConvBlock`s against `fuse_conv_blocks`: time per Denoiser call per batch size.
+
+    python -m benchmarks.fused_conv_blocks --batch-sizes 1 8 32
+"""
+import argparse
+
+import torch
+
+from benchmarks.common import build_denoiser, timed
+from model.fusion import fuse_conv_blocks, unfuse_conv_blocks
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 8, 32])
+    parser.add_argument('--hidden-dim', type=int, default=256)
+    parser.add_argument('--n-layers', type=int, default=8)
+    parser.add_argument('--repeats', type=int, default=10)
+    args = parser.parse_args()
+
+    model = build_denoiser(args.hidden_dim, args.n_layers)
+    print(f"{'batch':>5} {'eager ms':>9} {'fused ms':>9} {'speedup':>8}")
+    with torch.inference_mode():
+        for N in args.batch_sizes:
+            x = torch.randn(N, 1, 28, 28)
+            timestep = torch.full((N,), 500)
+            results = []
+            for fuse in (False, True):
+                fuse_conv_blocks(model) if fuse else unfuse_conv_blocks(model)
+                step = lambda: model(x, timestep)
+                results.append(timed(step, args.repeats))
+            eager, fused = results
+            print(f"{N:>5} {eager * 1e3:>9.1f} {fused * 1e3:>9.1f} {eager / fused:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,54 @@
+"""
+Import-time budget for the inference modules, measured with `python -X importtime`.
+
+torch is imported first so only the cost added by our modules is counted. Fails (exit 1)
+when a module exceeds its budget or pulls in a visualisation-only dependency.
+
+    python -m benchmarks.import_time
+"""
+import argparse
+import subprocess
+import sys
+
+BUDGETS_MS = {
+    'model.Denoiser': 20.,
+    'model.Diffusion': 30.,
+    'model.checkpoint': 30.,
+    'model.utils': 20.,
+    'serving.server': 60.,
+}
+FORBIDDEN = ('matplotlib', 'torchvision', 'PIL')
+
+
+def import_time(module):
+    # Returns (cumulative microseconds of `module`, names of every module imported after torch)
+    stderr = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import torch; import {module}'],
+                            check=True, capture_output=True, text=True).stderr
+    lines = [line.split('|') for line in stderr.splitlines() if line.startswith('import time:') and '|' in line]
+    names = [name.strip() for _, _, name in lines[1:]]
+    after_torch = names[names.index('torch') + 1:]
+    cumulative = next(int(us) for _, us, name in lines[1:] if name.strip() == module)
+    return cumulative, after_torch
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeats', type=int, default=5)
+    parser.add_argument('--scale', type=float, default=1., help='multiply every budget, e.g. on slow machines')
+    args = parser.parse_args()
+
+    failed = False
+    print(f"{'module':>18} {'ms':>7} {'budget':>7}")
+    for module, budget in BUDGETS_MS.items():
+        timings, imported = zip(*(import_time(module) for _ in range(args.repeats)))
+        ms = min(timings) / 1000
+        forbidden = sorted({name for name in imported[0] if name.split('.')[0] in FORBIDDEN})
+        ok = ms <= budget * args.scale and not forbidden
+        failed |= not ok
+        print(f"{module:>18} {ms:>7.1f} {budget * args.scale:>7.1f} {'ok' if ok else 'FAIL'}"
+              + (f"  imports {', '.join(forbidden)}" if forbidden else ''))
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Training and sampling per precision / memory-format mode: training samples/s and the loss curve
+against fp32 (same initial weights, data, timesteps and noise), sampling steps/s and the max
+difference of seeded samples against fp32.
+
+    python -m benchmarks.mixed_precision --modes fp32 fp32-cl bf16 bf16-cl --train-steps 50
+"""
+import argparse
+import time
+
+import torch
+
+from benchmarks.common import build
+from model.training import train_step
+
+
+def build_mode(args, mode):
+    # Same seeded weights for every mode
+    precision, _, layout = mode.partition('-')
+    return build(args.hidden_dim, args.n_layers, args.steps, device=args.device, precision=precision,
+                 channels_last=layout == 'cl')
+
+
+def train_curve(diffusion, batches, lr):
+    optimizer = torch.optim.Adam(diffusion.model.parameters(), lr=lr)
+    scaler = torch.amp.GradScaler(diffusion.device.type, enabled=diffusion.precision == 'fp16')
+    diffusion.train()
+    torch.manual_seed(1)
+    losses = [train_step(diffusion, batches[0], optimizer, scaler)]
+    start = time.perf_counter()
+    losses += [train_step(diffusion, x, optimizer, scaler) for x in batches[1:]]
+    seconds = time.perf_counter() - start
+    return torch.stack(losses).cpu(), (len(batches) - 1) * len(batches[0]) / seconds
+
+
+def sample_rate(diffusion, N, repeats):
+    diffusion.eval()
+    samples = diffusion.sample(N, seed=0)
+    start = time.perf_counter()
+    for _ in range(repeats):
+        diffusion.sample(N, seed=0)
+    return samples, repeats * diffusion.n_times / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--modes', nargs='+', default=['fp32', 'fp32-cl', 'bf16', 'bf16-cl'],
+                        help="precision ('fp32', 'bf16', 'fp16'), with '-cl' for channels_last")
+    parser.add_argument('--device', default='cpu')
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--train-steps', type=int, default=50)
+    parser.add_argument('--lr', type=float, default=5e-5)
+    parser.add_argument('--sample-batch-size', type=int, default=16)
+    parser.add_argument('--steps', type=int, default=100)
+    parser.add_argument('--hidden-dim', type=int, default=256)
+    parser.add_argument('--n-layers', type=int, default=8)
+    parser.add_argument('--repeats', type=int, default=1)
+    args = parser.parse_args()
+
+    torch.manual_seed(0)
+    batches = [torch.rand(args.batch_size, 1, 28, 28, device=args.device) for _ in range(args.train_steps + 1)]
+    reference = None
+    print(f"{'mode':>8} {'train img/s':>12} {'final loss':>11} {'max loss diff':>14} {'sample steps/s':>15} "
+          f"{'max sample diff':>16}")
+    for mode in args.modes:
+        losses, train_rate = train_curve(build_mode(args, mode), batches, args.lr)
+        samples, steps_rate = sample_rate(build_mode(args, mode), args.sample_batch_size, args.repeats)
+        if reference is None:
+            reference = losses, samples
+        loss_diff = (losses - reference[0]).abs().max().item()
+        sample_diff = (samples - reference[1]).abs().max().item()
+        print(f"{mode:>8} {train_rate:>12.1f} {losses[-10:].mean():>11.4f} {loss_diff:>14.2e} {steps_rate:>15.1f} "
+              f"{sample_diff:>16.2e}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,44 @@
+"""
+PyTorch eager against `OnnxSampler` (onnxruntime, CPU execution provider) on a few
+`hidden_dims` configs: max difference of seeded samples and reverse steps per second.
+
+    python -m benchmarks.onnx_sampling --configs 64x4 128x4 256x8 --batch-sizes 1 16 --steps 50
+"""
+import argparse
+import os
+
+import torch
+
+from benchmarks.common import build, timed
+from model.export import export_onnx
+from model.OnnxSampler import OnnxSampler
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--configs', nargs='+', default=['64x4', '128x4', '256x8'], help='hidden_dim x n_layers')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 16])
+    parser.add_argument('--steps', type=int, default=50)
+    parser.add_argument('--threads', type=int, default=torch.get_num_threads(), help='for both torch and ORT')
+    parser.add_argument('--repeats', type=int, default=2)
+    parser.add_argument('--dir', default='/tmp')
+    args = parser.parse_args()
+    torch.set_num_threads(args.threads)
+
+    print(f"{'config':>7} {'batch':>5} {'max diff':>9} {'eager steps/s':>14} {'ORT steps/s':>12} {'speedup':>8}")
+    for config in args.configs:
+        hidden_dim, n_layers = map(int, config.split('x'))
+        diffusion = build(hidden_dim, n_layers, args.steps)
+        path = os.path.join(args.dir, f'onnx_sampling_{config}.onnx')
+        export_onnx(diffusion, path)
+        sampler = OnnxSampler(diffusion, path, intra_op_threads=args.threads)
+        for N in args.batch_sizes:
+            diff = (sampler.sample(N, seed=0) - diffusion.sample(N, seed=0)).abs().max().item()
+            eager = timed(lambda: diffusion.sample(N, seed=0), args.repeats)
+            ort = timed(lambda: sampler.sample(N, seed=0), args.repeats)
+            print(f"{config:>7} {N:>5} {diff:>9.2e} {args.steps / eager:>14.1f} {args.steps / ort:>12.1f} "
+                  f"{eager / ort:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
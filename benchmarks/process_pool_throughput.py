@@ -0,0 +1,39 @@
+"""
+Sampling throughput of one process using every core against k pinned processes with n/k
+threads each.
+
+    python -m benchmarks.process_pool_throughput --N 256 --sampler ddim --steps 20 --workers 1 2 4
+"""
+import argparse
+import os
+import time
+
+from serving.process_pool import ProcessPoolSampler
+from serving.server import add_model_arguments
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    add_model_arguments(parser)
+    parser.add_argument('--N', type=int, default=256)
+    parser.add_argument('--sampler', default='ddim')
+    parser.add_argument('--steps', type=int, default=20)
+    parser.add_argument('--workers', type=int, nargs='+')
+    parser.add_argument('--repeats', type=int, default=3)
+    args = parser.parse_args()
+    n_cores = len(os.sched_getaffinity(0))
+    workers = args.workers or [k for k in (1, 2, 4, 8, 16) if k <= n_cores]
+
+    print(f"{'processes':>9} {'threads':>7} {'images/s':>9}")
+    for k in workers:
+        with ProcessPoolSampler(args, k, (args.sampler, args.steps, 0.)) as pool:
+            pool.sample(k)
+            start = time.perf_counter()
+            for _ in range(args.repeats):
+                pool.sample(args.N)
+            elapsed = (time.perf_counter() - start) / args.repeats
+        print(f"{k:>9} {n_cores // k:>7} {args.N / elapsed:>9.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""
+Float `Denoiser` against `QuantizedDenoiser` calibrated with one or more timestep ranges:
+time per reverse step, epsilon error relative to float, PSNR of seeded samples against the
+float samples and, given a classifier, how often it assigns float and int8 samples the same
+label and how confident it is.
+
+    python -m benchmarks.quantized_sampling --checkpoint denoiser.ckpt --classifier mnist_classifier.ts
+"""
+import argparse
+import time
+
+import torch
+
+from benchmarks.common import build, timed
+from model.checkpoint import load_diffusion
+from model.Diffusion import Diffusion
+from model.QuantizedDenoiser import QuantizedDenoiser
+
+
+def sample(diffusion, n_samples, batch_size):
+    # Sample ids continue past the calibration ids, so the evaluation trajectories are unseen
+    chunks = []
+    for start in range(0, n_samples, batch_size):
+        sample_ids = torch.arange(start, min(start + batch_size, n_samples)) + 1_000_000
+        chunks.append(diffusion.sample(len(sample_ids), seed=1, sample_ids=sample_ids))
+    return torch.cat(chunks)
+
+
+@torch.inference_mode()
+def epsilon_error(diffusion, model, n_samples):
+    generator = torch.Generator().manual_seed(2)
+    d = diffusion
+    x_0 = torch.rand((n_samples, d.img_C, d.img_H, d.img_W), generator=generator) * 2 - 1
+    t = torch.randint(0, d.n_times, (n_samples,), generator=generator)
+    x_t, _ = d.make_noisy(x_0, t)
+    reference = d.predict_epsilon(x_t, t)
+    return ((model(x_t, t) - reference).pow(2).mean() / reference.pow(2).mean()).item()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--checkpoint', help='flat checkpoint; a randomly initialised model otherwise')
+    parser.add_argument('--classifier', help='TorchScript classifier taking [N, C, H, W] images in [0, 1]')
+    parser.add_argument('--n-ranges', type=int, nargs='+', default=[1, 10])
+    parser.add_argument('--calibration-samples', type=int, default=32)
+    parser.add_argument('--n-samples', type=int, default=64)
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--steps', type=int, default=100)
+    parser.add_argument('--hidden-dim', type=int, default=256)
+    parser.add_argument('--n-layers', type=int, default=8)
+    parser.add_argument('--repeats', type=int, default=5)
+    args = parser.parse_args()
+
+    if args.checkpoint is not None:
+        diffusion = load_diffusion(args.checkpoint)
+    else:
+        diffusion = build(args.hidden_dim, args.n_layers, args.steps)
+    classifier = torch.jit.load(args.classifier).eval() if args.classifier is not None else None
+    reference = sample(diffusion, args.n_samples, args.batch_size)
+    x_t = torch.randn(args.batch_size, diffusion.img_C, diffusion.img_H, diffusion.img_W)
+    timestep = torch.full((args.batch_size,), diffusion.n_times // 2)
+    with torch.inference_mode():
+        float_step = timed(lambda: diffusion.predict_epsilon(x_t, timestep), args.repeats)
+        reference_probs = classifier(reference).softmax(-1) if classifier is not None else None
+    print(f"float: {float_step * 1e3:.1f} ms/step at batch {args.batch_size}")
+    if reference_probs is not None:
+        print(f"float: classifier confidence {reference_probs.max(-1).values.mean():.3f}")
+
+    for n_ranges in args.n_ranges:
+        start = time.perf_counter()
+        quantized = QuantizedDenoiser.from_calibration(diffusion, n_ranges, n_samples=args.calibration_samples,
+                                                       batch_size=args.batch_size)
+        calibration = time.perf_counter() - start
+        quantized_diffusion = Diffusion(quantized, [diffusion.img_H, diffusion.img_W, diffusion.img_C],
+                                        device=diffusion.device, schedule=diffusion.schedule)
+        with torch.inference_mode():
+            int8_step = timed(lambda: quantized(x_t, timestep), args.repeats)
+        samples = sample(quantized_diffusion, args.n_samples, args.batch_size)
+        psnr = 10 * torch.log10(1 / (samples - reference).pow(2).mean()).item()
+        report = (f"int8, {n_ranges:>2} ranges: {int8_step * 1e3:.1f} ms/step ({float_step / int8_step:.2f}x), "
+                  f"epsilon rel. MSE {epsilon_error(diffusion, quantized, args.n_samples):.2e}, "
+                  f"sample PSNR {psnr:.1f} dB, calibration {calibration:.1f}s")
+        if classifier is not None:
+            with torch.inference_mode():
+                probs = classifier(samples).softmax(-1)
+            agreement = (probs.argmax(-1) == reference_probs.argmax(-1)).float().mean()
+            report += f", label agreement {agreement:.3f}, confidence {probs.max(-1).values.mean():.3f}"
+        print(report)
+
+
+if __name__ == '__main__':
+    main()
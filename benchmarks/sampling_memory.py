@@ -0,0 +1,79 @@
+"""
+Peak memory of `Diffusion.sample` against the number of reverse steps.
+
+Each measurement runs in a fresh process so peak RSS (or the CUDA allocator peak)
+belongs to that run only. The `legacy` mode reproduces the original loop, which
+records autograd history through every step; `engine` is `Diffusion.sample`.
+
+    python -m benchmarks.sampling_memory --steps 10 50 100 200
+"""
+import argparse
+import json
+import resource
+import subprocess
+import sys
+
+import torch
+
+from model.Denoiser import Denoiser
+from model.Diffusion import Diffusion
+
+
+def legacy_sample(diffusion, N):
+    x_t = torch.randn((N, diffusion.img_C, diffusion.img_H, diffusion.img_W)).to(diffusion.device)
+    for t in range(diffusion.n_times - 1, -1, -1):
+        timestep = torch.tensor([t]).repeat_interleave(N, dim=0).long().to(diffusion.device)
+        z = torch.randn_like(x_t) if t > 1 else torch.zeros_like(x_t)
+        epsilon_pred = diffusion.model(x_t, timestep)
+        alpha = diffusion.extract(diffusion.alphas, timestep, x_t.shape)
+        sqrt_alpha = diffusion.extract(diffusion.sqrt_alphas, timestep, x_t.shape)
+        sqrt_one_minus_alpha_bar = diffusion.extract(diffusion.sqrt_one_minus_alpha_bars, timestep, x_t.shape)
+        sqrt_beta = diffusion.extract(diffusion.sqrt_betas, timestep, x_t.shape)
+        x_t = (1 / sqrt_alpha * (x_t - (1 - alpha) / sqrt_one_minus_alpha_bar * epsilon_pred) + sqrt_beta * z).clamp(-1., 1)
+    return diffusion.reverse_scale_to_zero_to_one(x_t)
+
+
+def measure(args):
+    device = args.device
+    model = Denoiser((28, 28, 1), hidden_dims=[args.hidden_dim] * args.n_layers,
+                     diffusion_time_embedding_dim=args.hidden_dim, n_times=args.n_times).to(device)
+    diffusion = Diffusion(model, n_times=args.n_times, device=device)
+    if device.startswith('cuda'):
+        torch.cuda.reset_peak_memory_stats()
+    if args.mode == 'legacy':
+        legacy_sample(diffusion, args.N)
+    else:
+        diffusion.sample(args.N)
+    if device.startswith('cuda'):
+        peak_mb = torch.cuda.max_memory_allocated() / 2 ** 20
+    else:
+        peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2 ** 10
+    print(json.dumps({'mode': args.mode, 'n_times': args.n_times, 'peak_mb': peak_mb}))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--steps', type=int, nargs='+', default=[10, 50, 100, 200])
+    parser.add_argument('--modes', nargs='+', default=['legacy', 'engine'])
+    parser.add_argument('--N', type=int, default=8)
+    parser.add_argument('--hidden-dim', type=int, default=64)
+    parser.add_argument('--n-layers', type=int, default=4)
+    parser.add_argument('--device', default='cuda' if torch.cuda.is_available() else 'cpu')
+    parser.add_argument('--mode', help=argparse.SUPPRESS)
+    parser.add_argument('--n-times', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.mode is not None:
+        return measure(args)
+
+    print(f"{'mode':>8} {'steps':>6} {'peak MB':>10}")
+    for mode in args.modes:
+        for n_times in args.steps:
+            cmd = [sys.executable, '-m', 'benchmarks.sampling_memory', '--mode', mode, '--n-times', str(n_times),
+                   '--N', str(args.N), '--hidden-dim', str(args.hidden_dim), '--n-layers', str(args.n_layers),
+                   '--device', args.device]
+            result = json.loads(subprocess.run(cmd, check=True, capture_output=True, text=True).stdout)
+            print(f"{mode:>8} {n_times:>6} {result['peak_mb']:>10.1f}")
+
+
+if __name__ == '__main__':
+    main()
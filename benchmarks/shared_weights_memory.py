@@ -0,0 +1,63 @@
+"""
+Worker start-up time and memory with per-worker checkpoint loading against workers that
+attach to shared-memory weights.
+
+Memory is the summed PSS of the workers (shared pages are split between the processes
+that map them), so one shared copy of the weights shows up once rather than per worker.
+
+    python -m benchmarks.shared_weights_memory --workers 1 2 4
+"""
+import argparse
+import os
+import time
+
+import torch
+
+from serving.process_pool import ProcessPoolSampler
+from serving.server import add_model_arguments, build_diffusion
+
+
+def pss_mb(pid):
+    with open(f'/proc/{pid}/smaps_rollup') as f:
+        for line in f:
+            if line.startswith('Pss:'):
+                return int(line.split()[1]) / 2 ** 10
+    return 0.
+
+
+def measure(make_pool, k):
+    start = time.perf_counter()
+    pool = make_pool(k)
+    pool.sample(k)
+    startup = time.perf_counter() - start
+    memory = sum(pss_mb(p.pid) for p in pool.pool._pool)
+    pool.close()
+    return startup, memory
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    add_model_arguments(parser)
+    parser.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4])
+    args = parser.parse_args()
+    args.device = 'cpu'
+    if args.checkpoint is None:
+        state_dict = build_diffusion(args).model.state_dict()
+        args.checkpoint = '/tmp/shared_weights_benchmark.pt'
+        torch.save(state_dict, args.checkpoint)
+    cores = sorted(os.sched_getaffinity(0)) * max(args.workers)
+    sampler_args = ('ddim', 2, 0.)
+    modes = {
+        'load': lambda k: ProcessPoolSampler(args, k, sampler_args, threads_per_worker=1, cores=cores[:k]),
+        'shared': lambda k: ProcessPoolSampler.from_diffusion(build_diffusion(args), k, sampler_args,
+                                                              threads_per_worker=1, cores=cores[:k]),
+    }
+    print(f"{'mode':>7} {'workers':>7} {'startup s':>10} {'workers PSS MB':>15}")
+    for name, make_pool in modes.items():
+        for k in args.workers:
+            startup, memory = measure(make_pool, k)
+            print(f"{name:>7} {k:>7} {startup:>10.2f} {memory:>15.1f}")
+
+
+if __name__ == '__main__':
+    main()
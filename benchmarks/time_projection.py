@@ -0,0 +1,55 @@
+"""
+1x1 ConvBlock against LinearBlock `time_project` at small batch sizes: the time projection alone
+(unique timesteps, as in training and in building the time table), a training step, and a
+sampling step. Both models share the same weights.
+
+    python -m benchmarks.time_projection --batch-sizes 1 4 16
+"""
+import argparse
+
+import torch
+
+from benchmarks.common import build_denoiser, timed
+from model.Diffusion import Diffusion
+
+
+def train_step(diffusion, optimizer, x_0):
+    optimizer.zero_grad(set_to_none=True)
+    _, epsilon, pred_epsilon = diffusion(x_0)
+    torch.nn.functional.mse_loss(pred_epsilon, epsilon).backward()
+    optimizer.step()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 4, 16])
+    parser.add_argument('--hidden-dim', type=int, default=256)
+    parser.add_argument('--n-layers', type=int, default=8)
+    parser.add_argument('--repeats', type=int, default=20)
+    args = parser.parse_args()
+
+    conv = build_denoiser(args.hidden_dim, args.n_layers, linear_time_project=False).train()
+    linear = build_denoiser(args.hidden_dim, args.n_layers).train()
+    linear.load_state_dict(conv.state_dict())
+    diffusions = [Diffusion(model, device='cpu') for model in (conv, linear)]
+    optimizers = [torch.optim.Adam(model.parameters(), lr=0) for model in (conv, linear)]
+
+    print(f"{'batch':>5} {'stage':>8} {'conv ms':>8} {'linear ms':>10} {'speedup':>8}")
+    for N in args.batch_sizes:
+        timestep = torch.randint(0, 1000, (N,))
+        x_0 = torch.rand(N, 1, 28, 28)
+        x_t = torch.randn(N, 1, 28, 28)
+        stages = {
+            'project': lambda d, o: d.model.project_time(timestep.unique()),
+            'train': lambda d, o: train_step(d, o, x_0),
+            'sample': lambda d, o: d.denoise_at_t(x_t, timestep[:1].expand(N), t=int(timestep[0])),
+        }
+        for stage, fn in stages.items():
+            with torch.no_grad() if stage == 'project' else torch.enable_grad():
+                conv_time, linear_time = (timed(lambda: fn(d, o), args.repeats) for d, o in zip(diffusions, optimizers))
+            print(f"{N:>5} {stage:>8} {conv_time * 1e3:>8.2f} {linear_time * 1e3:>10.2f} "
+                  f"{conv_time / linear_time:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
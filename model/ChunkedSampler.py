@@ -0,0 +1,64 @@
+import os
+
+import numpy as np
+import torch
+import torch.nn as nn
+from model.image_io import encode_png, to_uint8
+
+
+class ChunkedSampler:
+    """
+        Samples N images in chunks sized to a memory budget and hands every chunk to a sink
+            Args:
+                sampler: object with `sample(N, seed=, sample_ids=)` (DDIMSampler, DPMSolverSampler, ...), defaults to the diffusion
+                memory_budget_mb: bound on the activations and sampler state of one chunk
+            Sample i draws all of its noise from the counter keyed by (seed, i), so every chunk size
+            sees identical noise. Outputs match unchunked sampling up to float rounding (~1e-6): the
+            Denoiser's kernels may pick a different reduction order for a different batch size
+    """
+
+    def __init__(self, diffusion, sampler=None, memory_budget_mb=512):
+        self.diffusion = diffusion
+        self.sampler = diffusion if sampler is None else sampler
+        self.memory_budget_mb = memory_budget_mb
+
+    def bytes_per_sample(self):
+        d = self.diffusion
+        width = max(m.out_channels for m in d.model.modules() if isinstance(m, nn.Conv2d))
+        # ~6 live activations of the widest layer inside a ConvBlock, ~8 image-sized sampler tensors
+        return 4 * d.img_H * d.img_W * (6 * width + 8 * d.img_C)
+
+    def chunk_size(self):
+        return max(1, self.memory_budget_mb * 2 ** 20 // self.bytes_per_sample())
+
+    def sample(self, N, sink, seed=0, chunk_size=None):
+        chunk_size = chunk_size or self.chunk_size()
+        for start in range(0, N, chunk_size):
+            sample_ids = torch.arange(start, min(start + chunk_size, N))
+            sink(start, self.sampler.sample(len(sample_ids), seed=seed, sample_ids=sample_ids))
+        return sink
+
+
+class MemmapSink:
+    """ Writes chunks into a [N, C, H, W] numpy memmap (float32, or uint8 in [0, 255]) """
+
+    def __init__(self, path, N, image_shape, dtype=np.float32):
+        self.array = np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=(N, *image_shape))
+
+    def __call__(self, start, images):
+        images = to_uint8(images) if self.array.dtype == np.uint8 else images.float().cpu()
+        self.array[start:start + len(images)] = images.numpy()
+        self.array.flush()
+
+
+class ImageDirectorySink:
+    """ Writes every sample to `<directory>/<index>.png` """
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def __call__(self, start, images):
+        for i, image in enumerate(to_uint8(images)):
+            with open(os.path.join(self.directory, f'{start + i:06d}.png'), 'wb') as f:
+                f.write(encode_png(image[None]))
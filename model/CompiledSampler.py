@@ -0,0 +1,80 @@
+import bisect
+import os
+
+import torch
+from model.SampleNoise import SampleNoise
+
+
+class CompiledSampler:
+    """
+        Ancestral sampling with the whole reverse step (Denoiser + update) compiled as one graph
+            Args:
+                buckets: static batch sizes; a batch is padded up to the next bucket, larger N is chunked
+                cache_path: file for compiled artifacts, loaded if present and written by `save_cache`
+                compile_kwargs: passed to `torch.compile` (e.g. mode='max-autotune-no-cudagraphs')
+            The Denoiser runs in the diffusion's `precision` and memory format, as in `Diffusion.sample`
+    """
+
+    def __init__(self, diffusion, buckets=(1, 8, 32, 64), cache_path=None, **compile_kwargs):
+        self.diffusion = diffusion
+        self.buckets = sorted(buckets)
+        self.cache_path = cache_path
+        if cache_path is not None and os.path.exists(cache_path):
+            with open(cache_path, 'rb') as f:
+                torch.compiler.load_cache_artifacts(f.read())
+        self.step = torch.compile(self.reverse_step, dynamic=False, **compile_kwargs)
+
+    def reverse_step(self, x_t, timestep, z, time_table):
+        d = self.diffusion
+        schedule = d.schedule
+        model_timestep = d.timestep_map[timestep] if hasattr(d, 'timestep_map') else timestep
+        if d.channels_last:
+            x_t = x_t.contiguous(memory_format=torch.channels_last)
+        with d.autocast():
+            epsilon_pred = d.model.denoise(x_t, time_table[model_timestep][..., None, None])
+        x_coef = schedule.reverse_x_coefs[timestep][:, None, None, None]
+        eps_coef = schedule.reverse_eps_coefs[timestep][:, None, None, None]
+        noise_coef = schedule.reverse_noise_coefs[timestep][:, None, None, None]
+        return (x_coef * x_t - eps_coef * epsilon_pred + noise_coef * z).clamp(-1., 1)
+
+    def bucket(self, N):
+        return self.buckets[min(bisect.bisect_left(self.buckets, N), len(self.buckets) - 1)]
+
+    @torch.inference_mode()
+    def warmup(self):
+        for size in self.buckets:
+            self.sample(size)
+
+    def save_cache(self, path=None):
+        artifacts = torch.compiler.save_cache_artifacts()
+        if artifacts is not None:
+            with open(path or self.cache_path, 'wb') as f:
+                f.write(artifacts[0])
+
+    @torch.inference_mode()
+    def sample_bucket(self, N, x_T, noise):
+        d = self.diffusion
+        B = self.bucket(N)
+        time_table = d.model.time_table()
+        x_t = torch.zeros((B, d.img_C, d.img_H, d.img_W), device=d.device)
+        x_t[:N] = noise.initial(x_t[:N]) if x_T is None else x_T
+        timesteps = torch.arange(d.n_times, device=d.device).unsqueeze(1).expand(-1, B)
+        z = torch.zeros_like(x_t)
+        for t in range(d.n_times - 1, -1, -1):
+            z[:N] = noise.randn(t, x_t[:N])
+            x_t = self.step(x_t, timesteps[t], z, time_table)
+        return d.reverse_scale_to_zero_to_one(x_t[:N])
+
+    def sample(self, N, x_T=None, seed=None, sample_ids=None):
+        sample_ids = torch.arange(N) if sample_ids is None else torch.as_tensor(sample_ids)
+        if seed is not None and torch.as_tensor(seed).dim():
+            seeds = torch.as_tensor(seed)
+        else:
+            seeds = None
+        chunks = []
+        for start in range(0, N, self.buckets[-1]):
+            stop = min(start + self.buckets[-1], N)
+            chunk_seed = seeds[start:stop] if seeds is not None else seed
+            noise = SampleNoise(chunk_seed, sample_ids[start:stop])
+            chunks.append(self.sample_bucket(stop - start, None if x_T is None else x_T[start:stop], noise))
+        return torch.cat(chunks)
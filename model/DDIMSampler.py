@@ -0,0 +1,58 @@
+import torch
+from model.SampleNoise import SampleNoise
+
+
+class DDIMSampler:
+    """
+        DDIM sampler over a strided subsequence of a trained `Diffusion` schedule
+            Args:
+                n_steps: number of denoiser evaluations (<= diffusion.n_times)
+                eta: 0 gives deterministic DDIM, 1 matches DDPM's posterior variance
+    """
+
+    def __init__(self, diffusion, n_steps=50, eta=0., clip_x0=True):
+        if not 1 <= n_steps <= diffusion.n_times:
+            raise ValueError(f"n_steps must be in [1, {diffusion.n_times}], got {n_steps}")
+        if not 0. <= eta <= 1.:
+            raise ValueError(f"eta must be in [0, 1], got {eta}")
+        self.diffusion = diffusion
+        self.n_steps = n_steps
+        self.eta = eta
+        self.clip_x0 = clip_x0
+        self.timesteps = torch.linspace(diffusion.n_times - 1, 0, n_steps).round().long().tolist()
+        alpha_bars = diffusion.schedule.alpha_bars.cpu()
+        self.coefs = []
+        for i, t in enumerate(self.timesteps):
+            alpha_bar = alpha_bars[t]
+            alpha_bar_prev = alpha_bars[self.timesteps[i + 1]] if i + 1 < n_steps else alpha_bar.new_tensor(1.)
+            sigma = eta * torch.sqrt((1 - alpha_bar_prev) / (1 - alpha_bar) * (1 - alpha_bar / alpha_bar_prev))
+            self.coefs.append((t,
+                               alpha_bar.sqrt().item(),
+                               (1 - alpha_bar).sqrt().item(),
+                               alpha_bar_prev.sqrt().item(),
+                               (1 - alpha_bar_prev - sigma ** 2).clamp(min=0).sqrt().item(),
+                               sigma.item()))
+
+    def step(self, x_t, timestep, coefs, noise):
+        _, sqrt_alpha_bar, sqrt_one_minus_alpha_bar, sqrt_alpha_bar_prev, dir_coef, sigma = coefs
+        epsilon_pred = self.diffusion.predict_epsilon(x_t, timestep)
+        x_0 = (x_t - sqrt_one_minus_alpha_bar * epsilon_pred) / sqrt_alpha_bar
+        if self.clip_x0:
+            x_0 = x_0.clamp(-1., 1)
+            epsilon_pred = (x_t - sqrt_alpha_bar * x_0) / sqrt_one_minus_alpha_bar
+        x_prev = sqrt_alpha_bar_prev * x_0 + dir_coef * epsilon_pred
+        if sigma > 0:
+            x_prev = x_prev + sigma * noise.randn(coefs[0], x_t)
+        return x_prev
+
+    @torch.inference_mode()
+    def sample(self, N, x_T=None, seed=None, sample_ids=None):
+        d = self.diffusion
+        noise = SampleNoise(seed, sample_ids)
+        x_t = torch.empty((N, d.img_C, d.img_H, d.img_W), device=d.device)
+        x_t = noise.initial(x_t) if x_T is None else x_T.to(d.device)
+        timestep = torch.empty((N,), dtype=torch.long, device=d.device)
+        for coefs in self.coefs:
+            timestep.fill_(coefs[0])
+            x_t = self.step(x_t, timestep, coefs, noise)
+        return d.reverse_scale_to_zero_to_one(x_t.clamp(-1., 1))
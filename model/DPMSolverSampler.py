@@ -0,0 +1,99 @@
+import math
+from collections import deque
+
+import torch
+from model.SampleNoise import SampleNoise
+
+
+class DPMSolverSampler:
+    """
+        Multistep DPM-Solver++ (data prediction) over a trained `Diffusion` schedule
+            Args:
+                n_steps: number of denoiser evaluations, 10-20 is usually enough
+                order: solver order, 1 (DDIM), 2 (2M) or 3 (3M)
+                spacing: 'time_uniform', 'logSNR' or 'quadratic' timestep spacing
+    """
+
+    SPACINGS = ('time_uniform', 'logSNR', 'quadratic')
+
+    def __init__(self, diffusion, n_steps=20, order=2, spacing='logSNR', clip_x0=True, lower_order_final=True):
+        if not 1 <= n_steps <= diffusion.n_times:
+            raise ValueError(f"n_steps must be in [1, {diffusion.n_times}], got {n_steps}")
+        if order not in (1, 2, 3):
+            raise ValueError(f"order must be 1, 2 or 3, got {order}")
+        if spacing not in self.SPACINGS:
+            raise ValueError(f"spacing must be one of {self.SPACINGS}, got {spacing!r}")
+        self.diffusion = diffusion
+        self.order = order
+        self.spacing = spacing
+        self.clip_x0 = clip_x0
+        self.lower_order_final = lower_order_final
+        alpha_bars = diffusion.schedule.alpha_bars.cpu()
+        alphas = torch.sqrt(alpha_bars)
+        sigmas = torch.sqrt(1 - alpha_bars)
+        lambdas = torch.log(alphas) - torch.log(sigmas)
+        self.timesteps = self.get_timesteps(lambdas, diffusion.n_times, n_steps, spacing)
+        self.n_steps = len(self.timesteps)
+        self.alphas = [alphas[t].item() for t in self.timesteps]
+        self.sigmas = [sigmas[t].item() for t in self.timesteps]
+        self.lambdas = [lambdas[t].item() for t in self.timesteps]
+
+    @staticmethod
+    def get_timesteps(lambdas, n_times, n_steps, spacing):
+        if spacing == 'time_uniform':
+            timesteps = torch.linspace(n_times - 1, 0, n_steps, dtype=torch.float64)
+        elif spacing == 'quadratic':
+            timesteps = torch.linspace(math.sqrt(n_times - 1), 0, n_steps, dtype=torch.float64) ** 2
+        else:
+            # `lambdas` decreases with t, so interpolate t on the flipped (increasing) table
+            targets = torch.linspace(lambdas[-1].item(), lambdas[0].item(), n_steps, dtype=torch.float64)
+            increasing = lambdas.flip(0)
+            idx = torch.searchsorted(increasing, targets).clamp(1, n_times - 1)
+            lo, hi = increasing[idx - 1], increasing[idx]
+            frac = (targets - lo) / (hi - lo)
+            timesteps = (n_times - 1) - (idx - 1 + frac)
+        # Rounding can merge neighbours when n_steps is close to n_times
+        return list(dict.fromkeys(timesteps.round().long().clamp(0, n_times - 1).tolist()))
+
+    def data_prediction(self, x_t, timestep, i):
+        epsilon_pred = self.diffusion.predict_epsilon(x_t, timestep)
+        x_0 = (x_t - self.sigmas[i] * epsilon_pred) / self.alphas[i]
+        return x_0.clamp(-1., 1) if self.clip_x0 else x_0
+
+    def update(self, x_s, history, i, order):
+        alpha_t, sigma_t = self.alphas[i + 1], self.sigmas[i + 1]
+        h = self.lambdas[i + 1] - self.lambdas[i]
+        phi_1 = math.expm1(-h)
+        x_t = (sigma_t / self.sigmas[i]) * x_s - (alpha_t * phi_1) * history[0]
+        if order == 1:
+            return x_t
+        r0 = (self.lambdas[i] - self.lambdas[i - 1]) / h
+        D1_0 = (history[0] - history[1]) / r0
+        if order == 2:
+            return x_t - (0.5 * alpha_t * phi_1) * D1_0
+        r1 = (self.lambdas[i - 1] - self.lambdas[i - 2]) / h
+        D1_1 = (history[1] - history[2]) / r1
+        D1 = D1_0 + (r0 / (r0 + r1)) * (D1_0 - D1_1)
+        D2 = (D1_0 - D1_1) / (r0 + r1)
+        phi_2 = phi_1 / h + 1
+        phi_3 = phi_2 / h - 0.5
+        return x_t + (alpha_t * phi_2) * D1 - (alpha_t * phi_3) * D2
+
+    @torch.inference_mode()
+    def sample(self, N, x_T=None, seed=None, sample_ids=None):
+        d = self.diffusion
+        noise = SampleNoise(seed, sample_ids)
+        x_t = torch.empty((N, d.img_C, d.img_H, d.img_W), device=d.device)
+        x_t = noise.initial(x_t) if x_T is None else x_T.to(d.device)
+        timestep = torch.empty((N,), dtype=torch.long, device=d.device)
+        history = deque(maxlen=self.order)
+        for i, t in enumerate(self.timesteps):
+            timestep.fill_(t)
+            history.appendleft(self.data_prediction(x_t, timestep, i))
+            if i == self.n_steps - 1:
+                break
+            order = min(self.order, i + 1)
+            if self.lower_order_final and self.n_steps < 15:
+                order = min(order, self.n_steps - 1 - i)
+            x_t = self.update(x_t, history, i, order)
+        return d.reverse_scale_to_zero_to_one(history[0].clamp(-1., 1))
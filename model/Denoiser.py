@@ -1,28 +1,82 @@
+import torch
 import torch.nn as nn
 from model.SinusoidalPosEmb import SinusoidalPosEmb
 from model.ConvBlock import ConvBlock
+from model.LinearBlock import LinearBlock
 
 
 class Denoiser(nn.Module):
-    def __init__(self, image_resolution, hidden_dims=[256, 256], diffusion_time_embedding_dim=256, n_times=1000):
+    def __init__(self, image_resolution, hidden_dims=[256, 256], diffusion_time_embedding_dim=256, n_times=1000,
+                 linear_time_project=True):
         super(Denoiser, self).__init__()
         _, _, img_C = image_resolution
+        self.n_times = n_times
+        self.linear_time_project = linear_time_project
+        self.config = dict(image_resolution=list(image_resolution), hidden_dims=list(hidden_dims),
+                           diffusion_time_embedding_dim=diffusion_time_embedding_dim, n_times=n_times)
         self.time_embedding = SinusoidalPosEmb(diffusion_time_embedding_dim)
         self.in_project = ConvBlock(img_C, hidden_dims[0], kernel_size=7)
-        self.time_project = nn.Sequential(
-            ConvBlock(diffusion_time_embedding_dim, hidden_dims[0], kernel_size=1, activation_fn=True),
-            ConvBlock(hidden_dims[0], hidden_dims[0], kernel_size=1))
+        if linear_time_project:
+            # Same parameters (and state_dict) as the 1x1 ConvBlocks, as two GEMMs on [B, D]
+            self.time_project = nn.Sequential(
+                LinearBlock(diffusion_time_embedding_dim, hidden_dims[0], activation_fn=True),
+                LinearBlock(hidden_dims[0], hidden_dims[0]))
+        else:
+            self.time_project = nn.Sequential(
+                ConvBlock(diffusion_time_embedding_dim, hidden_dims[0], kernel_size=1, activation_fn=True),
+                ConvBlock(hidden_dims[0], hidden_dims[0], kernel_size=1))
         self.convs = nn.ModuleList([ConvBlock(in_channels=hidden_dims[0], out_channels=hidden_dims[0], kernel_size=3)])
         for idx in range(1, len(hidden_dims)):
             self.convs.append(
                 ConvBlock(hidden_dims[idx - 1], hidden_dims[idx], kernel_size=3, dilation=3 ** ((idx - 1) // 2),
                           activation_fn=True, gn=True, gn_groups=8))
         self.out_project = ConvBlock(hidden_dims[-1], out_channels=img_C, kernel_size=3)
+        self._time_table = None
+        self._time_table_key = None
+
+    def project_time(self, diffusion_timestep):
+        diffusion_embedding = self.time_embedding(diffusion_timestep)
+        if self.linear_time_project:
+            return self.time_project(diffusion_embedding)[..., None, None]
+        return self.time_project(diffusion_embedding.unsqueeze(-1).unsqueeze(-2))
+
+    @classmethod
+    def from_state_dict(cls, state_dict, device='cpu', **config):
+        # Build on the meta device and adopt the checkpoint tensors, skipping random init and a second copy
+        with torch.device('meta'):
+            model = cls(**config)
+        model.load_state_dict(state_dict, assign=True)
+        return model.to(device)
+
+    def time_table_key(self):
+        params = list(self.time_embedding.buffers()) + list(self.time_project.parameters())
+        return tuple((p.data_ptr(), p._version, p.dtype, p.device) for p in params)
+
+    def time_table(self):
+        # [n_times, hidden_dim] projected embeddings, rebuilt when the time_project weights change
+        key = self.time_table_key()
+        if self._time_table_key != key:
+            # Built outside autocast, also when first requested inside an autocast region
+            device = self.time_embedding.freqs.device
+            with torch.inference_mode(False), torch.no_grad(), torch.autocast(device.type, enabled=False):
+                timesteps = torch.arange(self.n_times, device=device)
+                self._time_table = self.project_time(timesteps).flatten(1)
+            self._time_table_key = key
+        return self._time_table
+
+    def embed_time(self, diffusion_timestep):
+        if not diffusion_timestep.is_floating_point():
+            if not (self.training or torch.is_grad_enabled()):
+                return self.time_table()[diffusion_timestep][..., None, None]
+            unique, inverse = diffusion_timestep.unique(return_inverse=True)
+            return self.project_time(unique)[inverse]
+        return self.project_time(diffusion_timestep)
 
     def forward(self, perturbed_x, diffusion_timestep):
+        return self.denoise(perturbed_x, self.embed_time(diffusion_timestep))
+
+    def denoise(self, perturbed_x, diffusion_embedding):
         y = perturbed_x
-        diffusion_embedding = self.time_embedding(diffusion_timestep)
-        diffusion_embedding = self.time_project(diffusion_embedding.unsqueeze(-1).unsqueeze(-2))
         y = self.in_project(y)
         for i in range(len(self.convs)):
             y = self.convs[i](y, diffusion_embedding, residual=True)
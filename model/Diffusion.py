@@ -0,0 +1,126 @@
+import contextlib
+
+import torch
+import torch.nn as nn
+from model.NoiseSchedule import NoiseSchedule
+from model.SampleNoise import SampleNoise
+from model.SamplingEngine import SamplingEngine
+
+
+class Diffusion(nn.Module):
+    """
+        Args:
+            precision: 'fp32', or 'bf16' / 'fp16' to run the Denoiser under autocast; the schedule
+                tables and the reverse update stay in fp32
+            channels_last: run the Denoiser's convolutions in NHWC
+    """
+
+    PRECISIONS = {'fp32': None, 'bf16': torch.bfloat16, 'fp16': torch.float16}
+
+    def __init__(self, model, image_resolution=[28, 28, 1], n_times=1000, beta_minmax=[1e-4, 2e-2], device='cuda',
+                 schedule='linear', precision='fp32', channels_last=False):
+        super(Diffusion, self).__init__()
+        if precision not in self.PRECISIONS:
+            raise ValueError(f"precision must be one of {tuple(self.PRECISIONS)}, got {precision!r}")
+        self.img_H, self.img_W, self.img_C = image_resolution
+        self.precision = precision
+        self.channels_last = channels_last
+        self.model = model.to(memory_format=torch.channels_last) if channels_last else model
+        if not isinstance(schedule, NoiseSchedule):
+            schedule = NoiseSchedule(n_times, schedule, beta_minmax)
+        self.schedule = schedule.to(device)
+        self.n_times = self.schedule.n_times
+        self.engine = SamplingEngine(self)
+
+    @property
+    def device(self):
+        return self.schedule.betas.device
+
+    @property
+    def alphas(self):
+        return self.schedule.alphas
+
+    @property
+    def sqrt_betas(self):
+        return self.schedule.sqrt_betas
+
+    @property
+    def sqrt_alphas(self):
+        return self.schedule.sqrt_alphas
+
+    @property
+    def sqrt_alpha_bars(self):
+        return self.schedule.sqrt_alpha_bars
+
+    @property
+    def sqrt_one_minus_alpha_bars(self):
+        return self.schedule.sqrt_one_minus_alpha_bars
+
+    @property
+    def reverse_coefs(self):
+        return self.schedule.reverse_coefs
+
+    def extract(self, a, t, x_shape):
+        b, *_ = t.shape
+        out = a.gather(-1, t)
+        return out.reshape(b, *((1,) * (len(x_shape) - 1)))
+
+    def scale_to_minus_one_to_one(self, x):
+        return x * 2 - 1
+
+    def reverse_scale_to_zero_to_one(self, x):
+        return (x + 1) * 0.5
+
+    def make_noisy(self, x_zeros, t, noise=None):
+        epsilon = (torch.randn_like(x_zeros) if noise is None else noise.randn(t, x_zeros)).to(self.device)
+        sqrt_alpha_bar = self.extract(self.sqrt_alpha_bars, t, x_zeros.shape)
+        sqrt_one_minus_alpha_bar = self.extract(self.sqrt_one_minus_alpha_bars, t, x_zeros.shape)
+        noisy_sample = x_zeros * sqrt_alpha_bar + epsilon * sqrt_one_minus_alpha_bar
+        return noisy_sample.detach(), epsilon
+
+    def forward(self, x_zeros, noise=None):
+        x_zeros = self.scale_to_minus_one_to_one(x_zeros)
+        B, _, _, _ = x_zeros.shape
+        t = torch.randint(low=0, high=self.n_times, size=(B,)).long().to(self.device)
+        perturbed_images, epsilon = self.make_noisy(x_zeros, t, noise)
+        pred_epsilon = self.predict_epsilon(perturbed_images, t)
+        return perturbed_images, epsilon, pred_epsilon
+
+    def autocast(self):
+        if self.precision == 'fp32':
+            # Not `autocast(enabled=False)`, which would switch off an enclosing autocast region
+            return contextlib.nullcontext()
+        return torch.autocast(self.device.type, dtype=self.PRECISIONS[self.precision])
+
+    def predict_epsilon(self, x_t, timestep):
+        if self.channels_last:
+            x_t = x_t.contiguous(memory_format=torch.channels_last)
+        with self.autocast():
+            return self.model(x_t, timestep)
+
+    def reverse_update(self, x_t, epsilon_pred, timestep, t=None, noise=None, out=None):
+        # Fused x_{t-1} update written into `out`; pass `t` when every sample shares that timestep
+        noise = SampleNoise() if noise is None else noise
+        if t is not None:
+            x_coef, eps_coef, noise_coef = self.reverse_coefs[t]
+            out = torch.mul(x_t, x_coef, out=out)
+            out.add_(epsilon_pred, alpha=-eps_coef)
+            if noise_coef:
+                out.add_(noise.randn(t, x_t), alpha=noise_coef)
+        else:
+            out = torch.mul(x_t, self.extract(self.schedule.reverse_x_coefs, timestep, x_t.shape), out=out)
+            out.addcmul_(self.extract(self.schedule.reverse_eps_coefs, timestep, x_t.shape), epsilon_pred, value=-1)
+            out.addcmul_(self.extract(self.schedule.reverse_noise_coefs, timestep, x_t.shape),
+                         noise.randn(timestep, x_t))
+        return out.clamp_(-1., 1)
+
+    @torch.inference_mode()
+    def denoise_at_t(self, x_t, timestep, t=None, out=None, noise=None):
+        epsilon_pred = self.predict_epsilon(x_t, timestep)
+        return self.reverse_update(x_t, epsilon_pred, timestep, t, noise=noise, out=out)
+
+    def sample(self, N, x_T=None, seed=None, sample_ids=None):
+        return self.engine.sample(N, x_T, seed, sample_ids)
+
+    def sample_progressive(self, N, stride=100, x_T=None, seed=None, sample_ids=None):
+        return self.engine.trajectory(N, stride, x_T, seed, sample_ids)
@@ -0,0 +1,94 @@
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+
+class FoldedDenoiser(nn.Module):
+    """
+        Inference view of a `Denoiser` with the time embedding folded into per-layer bias tables
+            A residual `ConvBlock` computes (x + e_t) + conv(x + e_t). The embedding is spatially
+            constant, so this equals x + conv(x) + B_t, where B_t = e_t + bias + conv(e_t) and
+            conv(e_t) is constant except where the kernel overlaps the zero padding. Rows (and
+            columns) that see the same set of in-bounds taps share a value, so each layer keeps a
+            [n_times, C, row patterns x column patterns] table, expanded to [C, H, W] per step by a
+            product with a one-hot [patterns, H x W] matrix.
+            The tables are a snapshot: rebuild after changing the Denoiser's weights
+    """
+
+    def __init__(self, model, check=True, atol=1e-4):
+        super(FoldedDenoiser, self).__init__()
+        self.model = model
+        self.n_times = model.n_times
+        self.img_H, self.img_W, _ = model.config['image_resolution']
+        with torch.no_grad(), torch.inference_mode(False):
+            time_table = model.time_table().clone()
+            for i, block in enumerate(model.convs):
+                block = getattr(block, 'block', block)
+                table, row_patterns, col_patterns = self.bias_table(block, time_table, self.img_H, self.img_W)
+                self.register_buffer(f'bias_table_{i}', table.flatten(2))
+                # One-hot (row pattern, column pattern) of every pixel
+                patterns = (row_patterns[:, None] * table.shape[-1] + col_patterns).flatten()
+                self.register_buffer(f'expand_{i}', F.one_hot(patterns, table[0, 0].numel()).T.to(table.dtype))
+        if check:
+            self.check_parity(atol)
+
+    @staticmethod
+    def tap_patterns(size, kernel_size, dilation, padding):
+        # For every output row, which kernel rows land inside the image; returns the distinct masks
+        # and the mask index of every row
+        offsets = torch.arange(kernel_size) * dilation - padding
+        rows = torch.arange(size).unsqueeze(1) + offsets
+        valid = (rows >= 0) & (rows < size)
+        patterns, index = valid.unique(dim=0, return_inverse=True)
+        return patterns.float(), index
+
+    @staticmethod
+    def bias_table(block, time_table, img_H, img_W):
+        if block.in_channels != block.out_channels or block.stride != (1, 1) or block.groups != 1:
+            raise ValueError("only residual, stride-1, ungrouped ConvBlocks can fold the time embedding")
+        kh, kw = block.kernel_size
+        row_masks, row_patterns = FoldedDenoiser.tap_patterns(img_H, kh, block.dilation[0], block.padding[0])
+        col_masks, col_patterns = FoldedDenoiser.tap_patterns(img_W, kw, block.dilation[1], block.padding[1])
+        weight = block.weight.float()
+        taps = torch.einsum('tc,ocij->toij', time_table.float(), weight)
+        table = torch.einsum('toij,ri,sj->tors', taps, row_masks.to(weight.device), col_masks.to(weight.device))
+        table += time_table.float()[:, :, None, None]
+        if block.bias is not None:
+            table += block.bias.float()[:, None, None]
+        return table.to(block.weight.dtype), row_patterns.to(weight.device), col_patterns.to(weight.device)
+
+    def bias_map(self, i, diffusion_timestep, shared):
+        # [C, H, W] when the whole batch shares a timestep, [B, C, H, W] otherwise
+        table = getattr(self, f'bias_table_{i}')
+        bias = table[diffusion_timestep[0]] if shared else table[diffusion_timestep]
+        return (bias @ getattr(self, f'expand_{i}')).unflatten(-1, (self.img_H, self.img_W))
+
+    def forward(self, perturbed_x, diffusion_timestep):
+        if diffusion_timestep.is_floating_point():
+            return self.model(perturbed_x, diffusion_timestep)
+        shared = bool((diffusion_timestep == diffusion_timestep[0]).all())
+        y = self.model.in_project(perturbed_x)
+        for i, block in enumerate(self.model.convs):
+            block = getattr(block, 'block', block)
+            x = y
+            y = F.conv2d(x, block.weight, None, block.stride, block.padding, block.dilation, block.groups)
+            y = y.add_(x).add_(self.bias_map(i, diffusion_timestep, shared))
+            y = block.group_norm(y) if block.group_norm is not None else y
+            y = block.activation_fn(y) if block.activation_fn is not None else y
+        return self.model.out_project(y)
+
+    @torch.no_grad()
+    def check_parity(self, atol=1e-4, batch_size=3):
+        # One shared timestep and a mixed batch including the first and last timesteps
+        generator = torch.Generator().manual_seed(0)
+        device = self.bias_table_0.device
+        x = torch.randn((batch_size, self.model.in_project.in_channels, self.img_H, self.img_W),
+                        generator=generator).to(device)
+        mixed = torch.randint(0, self.n_times, (batch_size,), generator=generator).to(device)
+        mixed[0], mixed[-1] = 0, self.n_times - 1
+        error = 0.
+        for timestep in (mixed[:1].expand(batch_size), mixed):
+            error = max(error, (self(x, timestep) - self.model(x, timestep)).abs().max().item())
+        if error > atol:
+            raise RuntimeError(f"folded time embedding differs from the Denoiser by {error:.3g} (atol {atol:.3g})")
+        return error
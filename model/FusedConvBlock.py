@@ -0,0 +1,75 @@
+import types
+
+import torch
+import torch.nn as nn
+import torch.nn.functional as F
+
+
+def conv_block(x, time_embedding, weight, bias, stride, padding, dilation, groups,
+               gn_groups, gn_weight, gn_bias, gn_eps, activation):
+    # `ConvBlock.forward` as a pure function of its weights; `time_embedding` is given only on the residual path
+    if time_embedding is not None:
+        x = x + time_embedding
+        y = x + F.conv2d(x, weight, bias, stride, padding, dilation, groups)
+    else:
+        y = F.conv2d(x, weight, bias, stride, padding, dilation, groups)
+    if gn_weight is not None:
+        y = F.group_norm(y, gn_groups, gn_weight, gn_bias, gn_eps)
+    return F.silu(y) if activation else y
+
+
+_compiled = {}
+
+
+def compiled_conv_block(variant, **compile_kwargs):
+    # One compiled copy of `conv_block` per block variant. Dynamo keeps its cache (and recompile limit)
+    # per code object, so each copy gets its own code object and only ever sees its own batch sizes
+    key = (variant, repr(sorted(compile_kwargs.items())))
+    if key not in _compiled:
+        code = conv_block.__code__.replace(co_name=f'conv_block_{len(_compiled)}')
+        function = types.FunctionType(code, conv_block.__globals__, code.co_name)
+        _compiled[key] = torch.compile(function, fullgraph=True, **compile_kwargs)
+    return _compiled[key]
+
+
+class FusedConvBlock(nn.Module):
+    """
+        Inference stand-in for a `ConvBlock` that runs the time-embedding add, conv, residual add,
+        GroupNorm and SiLU as one compiled region
+            The embedding add is fused into the kernel producing the conv input, and the residual add
+            into the GroupNorm statistics and normalize + SiLU kernels, so neither x + e feeding a
+            separate op nor conv(x) + x nor the normalized activation is materialised on its own.
+            Blocks share one compiled function per distinct (stride, padding, dilation, groups,
+            GroupNorm, activation) variant. The state_dict keeps the wrapped ConvBlock's keys, so
+            checkpoints load with or without fusion
+    """
+
+    def __init__(self, block, **compile_kwargs):
+        super(FusedConvBlock, self).__init__()
+        self.block = block
+        variant = (block.stride, block.padding, block.dilation, block.groups, block.group_norm is not None,
+                   block.activation_fn is not None)
+        self.fused = compiled_conv_block(variant, **compile_kwargs)
+        self.register_state_dict_post_hook(FusedConvBlock.as_block_keys)
+        self.register_load_state_dict_pre_hook(FusedConvBlock.from_block_keys)
+
+    @staticmethod
+    def as_block_keys(module, state_dict, prefix, local_metadata):
+        for name in [name for name in state_dict if name.startswith(prefix + 'block.')]:
+            state_dict[prefix + name.removeprefix(prefix + 'block.')] = state_dict.pop(name)
+
+    @staticmethod
+    def from_block_keys(module, state_dict, prefix, local_metadata, strict, missing_keys, unexpected_keys,
+                        error_msgs):
+        names = [name for name in state_dict if name.startswith(prefix) and not name.startswith(prefix + 'block.')]
+        for name in names:
+            state_dict[prefix + 'block.' + name.removeprefix(prefix)] = state_dict.pop(name)
+
+    def forward(self, x, time_embedding=None, residual=False):
+        block = self.block
+        gn = block.group_norm
+        return self.fused(x, time_embedding if residual else None, block.weight, block.bias, block.stride,
+                          block.padding, block.dilation, block.groups,
+                          gn.num_groups if gn is not None else None, gn.weight if gn is not None else None,
+                          gn.bias if gn is not None else None, gn.eps if gn is not None else None,
+                          block.activation_fn is not None)
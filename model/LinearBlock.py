@@ -0,0 +1,31 @@
+import torch.nn as nn
+
+
+class LinearBlock(nn.Linear):
+    """
+        Dense counterpart of a 1x1 `ConvBlock` applied to [B, C, 1, 1] inputs
+            Saves its weight as [out, in, 1, 1] and accepts either shape on load, so checkpoints
+            are interchangeable with the 1x1 ConvBlock it replaces
+    """
+
+    def __init__(self, in_features, out_features, activation_fn=None, bias=True):
+        super(LinearBlock, self).__init__(in_features, out_features, bias=bias)
+        self.activation_fn = nn.SiLU() if activation_fn else None
+        self.register_state_dict_post_hook(LinearBlock.as_conv_weight)
+        self.register_load_state_dict_pre_hook(LinearBlock.from_conv_weight)
+
+    @staticmethod
+    def as_conv_weight(module, state_dict, prefix, local_metadata):
+        weight = state_dict[prefix + 'weight']
+        state_dict[prefix + 'weight'] = weight.view(*weight.shape, 1, 1)
+
+    @staticmethod
+    def from_conv_weight(module, state_dict, prefix, local_metadata, strict, missing_keys, unexpected_keys,
+                         error_msgs):
+        weight = state_dict.get(prefix + 'weight')
+        if weight is not None and weight.dim() == 4:
+            state_dict[prefix + 'weight'] = weight.flatten(1)
+
+    def forward(self, x):
+        y = super(LinearBlock, self).forward(x)
+        return self.activation_fn(y) if self.activation_fn is not None else y
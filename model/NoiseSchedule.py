@@ -0,0 +1,91 @@
+import math
+
+import torch
+import torch.nn as nn
+
+
+class NoiseSchedule(nn.Module):
+    """
+        Variance schedule with every derived table registered as a buffer
+            Args:
+                schedule: 'linear', 'cosine', 'scaled_linear', a sequence of betas or a callable n_times -> betas
+                noiseless_steps: the reverse update adds no noise for t < noiseless_steps
+            Tables are computed in float64; `betas` and `alpha_bars` stay float64, per-step tables are float32
+    """
+
+    SCHEDULES = ('linear', 'cosine', 'scaled_linear')
+
+    def __init__(self, n_times=1000, schedule='linear', beta_minmax=[1e-4, 2e-2], cosine_s=0.008, max_beta=0.999,
+                 noiseless_steps=2):
+        super(NoiseSchedule, self).__init__()
+        if callable(schedule):
+            betas = schedule(n_times)
+        elif isinstance(schedule, str):
+            betas = self.make_betas(schedule, n_times, beta_minmax, cosine_s, max_beta)
+        else:
+            betas = schedule
+        betas = torch.as_tensor(betas, dtype=torch.float64).flatten()
+        if not ((betas > 0) & (betas < 1)).all():
+            raise ValueError("betas must lie in (0, 1)")
+        self.n_times = len(betas)
+        self.noiseless_steps = noiseless_steps
+        self.build(betas)
+        self.register_load_state_dict_post_hook(NoiseSchedule.after_load)
+
+    @staticmethod
+    def after_load(module, incompatible_keys):
+        module.build_reverse_coefs()
+
+    def _apply(self, fn, recurse=True):
+        # Device moves and other conversions go through, dtype casts (e.g. `diffusion.bfloat16()`) do not
+        def keep_dtype(t):
+            target = fn(t.new_empty(0))
+            return fn(t) if target.dtype == t.dtype else t.to(target.device)
+
+        return super(NoiseSchedule, self)._apply(keep_dtype, recurse)
+
+    @classmethod
+    def make_betas(cls, schedule, n_times, beta_minmax, cosine_s, max_beta):
+        beta_1, beta_T = beta_minmax
+        if schedule == 'linear':
+            return torch.linspace(beta_1, beta_T, n_times, dtype=torch.float64)
+        if schedule == 'scaled_linear':
+            return torch.linspace(beta_1 ** 0.5, beta_T ** 0.5, n_times, dtype=torch.float64) ** 2
+        if schedule == 'cosine':
+            # Nichol & Dhariwal (2021), eq. 17
+            steps = torch.arange(n_times + 1, dtype=torch.float64) / n_times
+            alpha_bars = torch.cos((steps + cosine_s) / (1 + cosine_s) * math.pi / 2) ** 2
+            return (1 - alpha_bars[1:] / alpha_bars[:-1]).clamp(max=max_beta)
+        raise ValueError(f"schedule must be one of {cls.SCHEDULES}, a sequence or a callable, got {schedule!r}")
+
+    @staticmethod
+    def reverse_tables(betas, noiseless_steps=2):
+        # x_{t-1} = x_coef * x_t - eps_coef * epsilon_pred + noise_coef * z, with no noise for t < noiseless_steps
+        alphas = 1 - betas
+        alpha_bars = torch.cumprod(alphas, dim=0)
+        x_coefs = 1 / torch.sqrt(alphas)
+        eps_coefs = betas / (torch.sqrt(1 - alpha_bars) * torch.sqrt(alphas))
+        noise_coefs = torch.sqrt(betas)
+        noise_coefs[:noiseless_steps] = 0
+        return x_coefs, eps_coefs, noise_coefs
+
+    def build(self, betas):
+        alphas = 1 - betas
+        alpha_bars = torch.cumprod(alphas, dim=0)
+        x_coefs, eps_coefs, noise_coefs = self.reverse_tables(betas, self.noiseless_steps)
+        self.register_buffer('betas', betas)
+        self.register_buffer('alpha_bars', alpha_bars)
+        self.register_buffer('alphas', alphas.float())
+        self.register_buffer('sqrt_betas', torch.sqrt(betas).float())
+        self.register_buffer('sqrt_alphas', torch.sqrt(alphas).float())
+        self.register_buffer('sqrt_alpha_bars', torch.sqrt(alpha_bars).float())
+        self.register_buffer('sqrt_one_minus_alpha_bars', torch.sqrt(1 - alpha_bars).float())
+        self.register_buffer('reverse_x_coefs', x_coefs.float())
+        self.register_buffer('reverse_eps_coefs', eps_coefs.float())
+        self.register_buffer('reverse_noise_coefs', noise_coefs.float())
+        self.build_reverse_coefs()
+
+    def build_reverse_coefs(self):
+        # Host-side copy for the shared-timestep fast path
+        tables = self.reverse_tables(self.betas.detach().double().cpu(), self.noiseless_steps)
+        self.reverse_coefs = list(zip(*(table.tolist() for table in tables)))
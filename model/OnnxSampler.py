@@ -0,0 +1,44 @@
+import torch
+
+
+class OnnxSampler:
+    """
+        Ancestral sampling with the Denoiser evaluated by onnxruntime's CPU execution provider
+            Args:
+                path: ONNX file written by `model.export.export_onnx`
+                intra_op_threads, inter_op_threads: ORT thread pool sizes, 0 lets ORT pick
+                optimized_path: if given, ORT saves the graph after its optimisations there
+            The exported graph is fp32, so the diffusion must be too; its memory format does not apply
+    """
+
+    def __init__(self, diffusion, path, intra_op_threads=0, inter_op_threads=0, optimized_path=None):
+        if diffusion.precision != 'fp32':
+            raise ValueError(f"onnxruntime runs the fp32 export, got a {diffusion.precision} diffusion")
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.intra_op_num_threads = intra_op_threads
+        options.inter_op_num_threads = inter_op_threads
+        if optimized_path is not None:
+            options.optimized_model_filepath = optimized_path
+        self.session = ort.InferenceSession(path, options, providers=['CPUExecutionProvider'])
+        self.diffusion = diffusion
+
+    def predict_epsilon(self, x_t, timestep):
+        d = self.diffusion
+        model_timestep = d.timestep_map[timestep] if hasattr(d, 'timestep_map') else timestep
+        inputs = {'x_t': x_t.cpu().numpy(), 'timestep': model_timestep.cpu().contiguous().numpy()}
+        return torch.from_numpy(self.session.run(None, inputs)[0]).to(d.device)
+
+    @torch.inference_mode()
+    def sample(self, N, x_T=None, seed=None, sample_ids=None):
+        # Same buffers, noise and update as `Diffusion.sample`; only the Denoiser call differs
+        d = self.diffusion
+        engine = d.engine
+        x_t, noise = engine.start(N, x_T, seed, sample_ids)
+        for i, t in enumerate(range(d.n_times - 1, -1, -1)):
+            timestep = engine.timesteps[t]
+            epsilon_pred = self.predict_epsilon(x_t, timestep)
+            x_t = d.reverse_update(x_t, epsilon_pred, timestep, t, noise=noise, out=engine.x_buffers[(i + 1) % 2])
+        return d.reverse_scale_to_zero_to_one(x_t)
@@ -0,0 +1,86 @@
+import torch
+import torch.nn as nn
+
+
+class QuantizedConvBlock(nn.Module):
+    """
+        Static int8 stand-in for a `ConvBlock`
+            Until `convert`, runs the float conv and records the min/max of its input and output
+            per timestep range; afterwards the conv runs on the quantized CPU kernels (per-channel
+            symmetric int8 weights, per-tensor quint8 activations with the range's qparams).
+            The time-embedding add, residual, GroupNorm and SiLU stay in float.
+    """
+
+    def __init__(self, block, n_ranges):
+        super(QuantizedConvBlock, self).__init__()
+        self.block = block
+        for name in ('input_min', 'output_min'):
+            self.register_buffer(name, torch.full((n_ranges,), float('inf')))
+        for name in ('input_max', 'output_max'):
+            self.register_buffer(name, torch.full((n_ranges,), float('-inf')))
+        self.packed_params = None
+
+    @staticmethod
+    def qparams(low, high):
+        # quint8 affine qparams for a range that always contains 0
+        low, high = min(low, 0.), max(high, 0.)
+        scale = max((high - low) / 255, 1e-8)
+        return scale, int(min(max(round(-low / scale), 0), 255))
+
+    def observe(self, x, y, ranges):
+        for r in ranges.unique().tolist():
+            rows = ranges == r
+            x_r, y_r = (x, y) if rows.all() else (x[rows], y[rows])
+            self.input_min[r] = torch.minimum(self.input_min[r], x_r.min())
+            self.input_max[r] = torch.maximum(self.input_max[r], x_r.max())
+            self.output_min[r] = torch.minimum(self.output_min[r], y_r.min())
+            self.output_max[r] = torch.maximum(self.output_max[r], y_r.max())
+
+    @torch.no_grad()
+    def convert(self):
+        block = self.block
+        # Ranges the calibration never visited borrow the union of the visited ones
+        for name in ('input', 'output'):
+            low, high = getattr(self, name + '_min'), getattr(self, name + '_max')
+            seen = torch.isfinite(low)
+            if not seen.any():
+                raise RuntimeError("QuantizedConvBlock.convert called before any calibration pass")
+            low[~seen], high[~seen] = low[seen].min(), high[seen].max()
+        self.input_qparams = [self.qparams(*bounds) for bounds in zip(self.input_min.tolist(), self.input_max.tolist())]
+        self.output_qparams = [self.qparams(*bounds) for bounds in zip(self.output_min.tolist(),
+                                                                        self.output_max.tolist())]
+        weight = block.weight.detach().float()
+        scales = (weight.abs().amax(dim=(1, 2, 3)) / 127).clamp(min=1e-8).double()
+        zero_points = torch.zeros(weight.shape[0], dtype=torch.long)
+        qweight = torch.quantize_per_channel(weight, scales, zero_points, 0, torch.qint8)
+        bias = None if block.bias is None else block.bias.detach().float()
+        self.packed_params = torch.ops.quantized.conv2d_prepack(qweight, bias, block.stride, block.padding,
+                                                                block.dilation, block.groups)
+
+    def range_qparams(self, name, ranges):
+        first = ranges[0].item()
+        if (ranges == first).all():
+            return getattr(self, name + '_qparams')[first]
+        # Mixed timestep ranges share one per-tensor scale covering all of them
+        low, high = getattr(self, name + '_min')[ranges].min(), getattr(self, name + '_max')[ranges].max()
+        return self.qparams(low.item(), high.item())
+
+    def conv(self, x, ranges):
+        block = self.block
+        if self.packed_params is None:
+            y = block._conv_forward(x, block.weight, block.bias)
+            self.observe(x, y, ranges)
+            return y
+        qx = torch.quantize_per_tensor(x.float().contiguous(), *self.range_qparams('input', ranges), torch.quint8)
+        return torch.ops.quantized.conv2d(qx, self.packed_params, *self.range_qparams('output', ranges)).dequantize()
+
+    def forward(self, x, time_embedding=None, residual=False, ranges=None):
+        block = self.block
+        if residual:
+            x = x + time_embedding
+            y = x + self.conv(x, ranges)
+        else:
+            y = self.conv(x, ranges)
+        y = block.group_norm(y) if block.group_norm is not None else y
+        y = block.activation_fn(y) if block.activation_fn is not None else y
+        return y
@@ -0,0 +1,58 @@
+import torch
+import torch.nn as nn
+from model.QuantizedConvBlock import QuantizedConvBlock
+
+
+class QuantizedDenoiser(nn.Module):
+    """
+        `Denoiser` with the 3x3 `convs` in static int8, for CPU sampling
+            in_project, out_project and the time projection stay in float. Activation qparams are
+            calibrated per timestep range by sampling through the model: see `from_calibration`
+            Args:
+                n_ranges: number of equal-width timestep ranges, each with its own activation qparams
+                float_convs: indices into `model.convs` kept in float as well
+    """
+
+    def __init__(self, model, n_ranges=10, float_convs=()):
+        super(QuantizedDenoiser, self).__init__()
+        self.model = model
+        self.n_times = model.n_times
+        self.n_ranges = n_ranges
+        # Fused blocks (see `fuse_conv_blocks`) are quantized from the ConvBlock they wrap
+        self.convs = nn.ModuleList([conv if i in float_convs else
+                                    QuantizedConvBlock(getattr(conv, 'block', conv), n_ranges)
+                                    for i, conv in enumerate(model.convs)])
+
+    @classmethod
+    @torch.no_grad()
+    def from_calibration(cls, diffusion, n_ranges=10, float_convs=(), n_samples=32, batch_size=8, seed=0):
+        # Observes the activations of full reverse trajectories, so every timestep range is visited
+        quantized = cls(diffusion.model, n_ranges, float_convs)
+        model, diffusion.model = diffusion.model, quantized
+        try:
+            for start in range(0, n_samples, batch_size):
+                sample_ids = torch.arange(start, min(start + batch_size, n_samples))
+                diffusion.sample(len(sample_ids), seed=seed, sample_ids=sample_ids)
+        finally:
+            diffusion.model = model
+        return quantized.convert()
+
+    def convert(self):
+        for conv in self.convs:
+            if isinstance(conv, QuantizedConvBlock):
+                conv.convert()
+        return self
+
+    def timestep_ranges(self, diffusion_timestep):
+        return (diffusion_timestep.long() * self.n_ranges // self.n_times).clamp_(0, self.n_ranges - 1)
+
+    def forward(self, perturbed_x, diffusion_timestep):
+        ranges = self.timestep_ranges(diffusion_timestep)
+        diffusion_embedding = self.model.embed_time(diffusion_timestep)
+        y = self.model.in_project(perturbed_x)
+        for conv in self.convs:
+            if isinstance(conv, QuantizedConvBlock):
+                y = conv(y, diffusion_embedding, residual=True, ranges=ranges)
+            else:
+                y = conv(y, diffusion_embedding, residual=True)
+        return self.model.out_project(y)
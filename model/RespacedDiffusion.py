@@ -0,0 +1,30 @@
+import torch
+from model.Diffusion import Diffusion
+from model.NoiseSchedule import NoiseSchedule
+
+
+class RespacedDiffusion(Diffusion):
+    """
+        K-step view of a trained `Diffusion` (improved DDPM respacing)
+            Betas are re-derived so the retained timesteps keep their alpha_bars; the denoiser still
+            sees the original timestep indices through `timestep_map`
+    """
+
+    def __init__(self, diffusion, n_steps):
+        if not 1 <= n_steps <= diffusion.n_times:
+            raise ValueError(f"n_steps must be in [1, {diffusion.n_times}], got {n_steps}")
+        timesteps = self.space_timesteps(diffusion.n_times, n_steps)
+        alpha_bars = diffusion.schedule.alpha_bars.cpu()[timesteps]
+        betas = 1 - alpha_bars / torch.cat([alpha_bars.new_ones(1), alpha_bars[:-1]])
+        schedule = NoiseSchedule(schedule=betas, noiseless_steps=1)
+        super(RespacedDiffusion, self).__init__(diffusion.model, [diffusion.img_H, diffusion.img_W, diffusion.img_C],
+                                                device=diffusion.device, schedule=schedule,
+                                                precision=diffusion.precision, channels_last=diffusion.channels_last)
+        self.register_buffer('timestep_map', timesteps.to(diffusion.device))
+
+    @staticmethod
+    def space_timesteps(n_times, n_steps):
+        return torch.linspace(0, n_times - 1, n_steps).round().long()
+
+    def predict_epsilon(self, x_t, timestep):
+        return super(RespacedDiffusion, self).predict_epsilon(x_t, self.timestep_map[timestep])
@@ -0,0 +1,106 @@
+import math
+import sys
+
+import torch
+
+M32 = 0xFFFFFFFF
+PHILOX_M = (0xD2511F53, 0xCD9E8D57)
+PHILOX_W = (0x9E3779B9, 0xBB67AE85)
+
+
+def mulhilo(a, b):
+    # 32x32 -> 64 bit product of constant `a` and int64 tensor `b` < 2^32, split into 16-bit halves to stay in int64
+    p_lo = a * (b & 0xFFFF)
+    p_hi = a * (b >> 16)
+    lo = p_lo + ((p_hi & 0xFFFF) << 16)
+    return (p_hi >> 16) + (lo >> 32), lo & M32
+
+
+def philox4x32(c0, c1, c2, c3, k0, k1, rounds=10):
+    # Philox4x32-10 (Salmon et al., 2011) on int64 tensors holding uint32 values
+    for _ in range(rounds):
+        hi0, lo0 = mulhilo(PHILOX_M[0], c0)
+        hi1, lo1 = mulhilo(PHILOX_M[1], c2)
+        c0, c1, c2, c3 = hi1 ^ c1 ^ k0, lo1, hi0 ^ c3 ^ k1, lo0
+        k0, k1 = (k0 + PHILOX_W[0]) & M32, (k1 + PHILOX_W[1]) & M32
+    return c0, c1, c2, c3
+
+
+class SampleNoise:
+    """
+        Gaussian noise keyed by (seed, sample_id, t) with a Philox counter
+            Args:
+                seed: int or per-sample LongTensor; None draws from the global generator instead
+                sample_ids: per-sample ids (defaults to 0..B-1)
+                stream: extra counter word, so draws keyed by the same (seed, sample_id, t) can be kept apart
+                buffer: preallocated tensor that global-generator draws are written into
+            A sample's noise at step t does not depend on its batch, chunk or process
+    """
+
+    INITIAL_T = -1
+
+    def __init__(self, seed=None, sample_ids=None, stream=0, buffer=None):
+        self.seed = seed
+        self.sample_ids = sample_ids
+        self.stream = stream
+        self.buffer = buffer
+
+    def initial(self, like):
+        # x_T, keyed apart from every reverse step
+        return self.randn(self.INITIAL_T, like)
+
+    def randn(self, t, like):
+        # `t`: int or per-sample LongTensor; returns noise shaped and placed like `like`
+        if self.seed is None:
+            if self.buffer is not None and self.buffer.shape == like.shape:
+                return self.buffer.normal_()
+            return torch.randn_like(like)
+        B, numel = like.shape[0], like[0].numel()
+        device = like.device
+        seed = torch.as_tensor(self.seed, dtype=torch.long, device=device).expand(B)[:, None]
+        ids = torch.arange(B, device=device) if self.sample_ids is None else torch.as_tensor(self.sample_ids, device=device)
+        t = torch.as_tensor(t, dtype=torch.long, device=device).expand(B)[:, None]
+        blocks = torch.arange((numel + 3) // 4, device=device)[None, :]
+        x0, x1, x2, x3 = philox4x32(blocks, ids.long()[:, None] & M32, t & M32, torch.full_like(t, self.stream),
+                                    seed & M32, (seed >> 32) & M32)
+        u0, u1, u2, u3 = (((x >> 8).float() + 0.5) * 2 ** -24 for x in (x0, x1, x2, x3))
+        r01, r23 = torch.sqrt(-2 * torch.log(u0)), torch.sqrt(-2 * torch.log(u2))
+        theta01, theta23 = 2 * math.pi * u1, 2 * math.pi * u3
+        z = torch.stack([r01 * torch.cos(theta01), r01 * torch.sin(theta01),
+                         r23 * torch.cos(theta23), r23 * torch.sin(theta23)], dim=-1)
+        return z.reshape(B, -1)[:, :numel].reshape(like.shape).to(like.dtype)
+
+
+# Philox4x32-10 known-answer vectors from Random123 (kat_vectors): (counter, key) -> output
+PHILOX_KAT = [
+    ((0, 0, 0, 0), (0, 0), (0x6627e8d5, 0xe169c58d, 0xbc57ac4c, 0x9b00dbd8)),
+    ((M32, M32, M32, M32), (M32, M32), (0x408f276d, 0x41c83b0e, 0xa20bc7c6, 0x6d5451fd)),
+    ((0x243f6a88, 0x85a308d3, 0x13198a2e, 0x03707344), (0xa4093822, 0x299f31d0),
+     (0xd16cfe09, 0x94fdcceb, 0x5001e420, 0x24126ea1)),
+]
+
+
+def self_test():
+    """ Checks `philox4x32` against Random123 and that a sample's noise does not depend on its batch """
+    for counter, key, expected in PHILOX_KAT:
+        output = philox4x32(*(torch.tensor(c) for c in counter), *(torch.tensor(k) for k in key))
+        if tuple(x.item() for x in output) != expected:
+            raise RuntimeError(f"philox4x32{counter + key} gives {[hex(x.item()) for x in output]}, "
+                               f"expected {[hex(x) for x in expected]}")
+    like = torch.empty(5, 3, 7, 7)
+    seeds, ids, t = torch.tensor([0, 1, 2 ** 40, 2 ** 63 - 1, 7]), torch.tensor([9, 0, 3, 3, 2 ** 33]), 11
+    batch = SampleNoise(seeds, ids).randn(t, like)
+    for i in range(len(like)):
+        single = SampleNoise(seeds[i], ids[i:i + 1]).randn(torch.tensor([t]), like[:1])
+        if not torch.equal(single[0], batch[i]):
+            raise RuntimeError(f"noise of sample {i} changes with its batch")
+    if torch.equal(batch[2], batch[3]):
+        raise RuntimeError("different seeds give the same noise")
+
+
+if __name__ == '__main__':
+    try:
+        self_test()
+    except RuntimeError as e:
+        sys.exit(f"SampleNoise self-test failed: {e}")
+    print("SampleNoise self-test passed")
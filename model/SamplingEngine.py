@@ -0,0 +1,84 @@
+import torch
+from model.SampleNoise import SampleNoise
+
+
+class SamplingEngine:
+    """ Reverse process under inference mode with preallocated ping-pong buffers """
+
+    def __init__(self, diffusion):
+        self.diffusion = diffusion
+        self.shape = None
+
+    def buffers(self, N):
+        d = self.diffusion
+        shape = (N, d.img_C, d.img_H, d.img_W)
+        x_buffers = torch.empty((2, *shape), device=d.device)
+        noise_buffer = torch.empty(shape, device=d.device)
+        # Row `t` is a stride-0 view of N copies of `t`, so no per-step timestep tensor is built
+        timesteps = torch.arange(d.n_times, device=d.device).unsqueeze(1).expand(-1, N)
+        return x_buffers, noise_buffer, timesteps
+
+    def allocate(self, N):
+        d = self.diffusion
+        shape = (N, d.img_C, d.img_H, d.img_W)
+        if self.shape == shape and self.x_buffers.device == d.device:
+            return
+        self.x_buffers, self.noise_buffer, self.timesteps = self.buffers(N)
+        self.shape = shape
+
+    def release(self):
+        for name in ('x_buffers', 'noise_buffer', 'timesteps'):
+            self.__dict__.pop(name, None)
+        self.shape = None
+
+    def start(self, N, x_T, seed, sample_ids, buffers=None):
+        # Per-sample counter noise when seeded, otherwise the global generator into `noise_buffer`.
+        # Uses the engine's cached buffers unless given a (x_buffers, noise_buffer, timesteps) of its own
+        if buffers is None:
+            self.allocate(N)
+            buffers = self.x_buffers, self.noise_buffer, self.timesteps
+        x_buffers, noise_buffer, _ = buffers
+        noise = SampleNoise(seed, sample_ids, buffer=noise_buffer)
+        x_T = noise.initial(x_buffers[0]) if x_T is None else x_T
+        return x_buffers[0].copy_(x_T), noise
+
+    def step(self, x_t, t, out, noise, return_x0=False, timesteps=None):
+        d = self.diffusion
+        timestep = (self.timesteps if timesteps is None else timesteps)[t]
+        epsilon_pred = d.predict_epsilon(x_t, timestep)
+        x_0 = None
+        if return_x0:
+            x_0 = (x_t - d.sqrt_one_minus_alpha_bars[t] * epsilon_pred) / d.sqrt_alpha_bars[t]
+        x_t_minus_1 = d.reverse_update(x_t, epsilon_pred, timestep, t, noise=noise, out=out)
+        return (x_t_minus_1, x_0) if return_x0 else x_t_minus_1
+
+    @torch.inference_mode()
+    def sample(self, N, x_T=None, seed=None, sample_ids=None):
+        d = self.diffusion
+        x_t, noise = self.start(N, x_T, seed, sample_ids)
+        for i, t in enumerate(range(d.n_times - 1, -1, -1)):
+            x_t = self.step(x_t, t, self.x_buffers[(i + 1) % 2], noise)
+        return d.reverse_scale_to_zero_to_one(x_t)
+
+    def trajectory(self, N, stride=100, x_T=None, seed=None, sample_ids=None):
+        """
+            Yields (t, x_{t-1}, predicted x_0) in [0, 1] after every `stride` steps and after t=0
+            Only the yielded copies outlive a step; closing the generator stops sampling. Every
+            generator owns its buffers, so it can be interleaved with `sample` or other trajectories
+        """
+        if stride < 1:
+            raise ValueError(f"stride must be at least 1, got {stride}")
+        return self._trajectory(N, stride, x_T, seed, sample_ids)
+
+    @torch.inference_mode()
+    def _trajectory(self, N, stride, x_T, seed, sample_ids):
+        d = self.diffusion
+        buffers = self.buffers(N)
+        x_buffers, _, timesteps = buffers
+        x_t, noise = self.start(N, x_T, seed, sample_ids, buffers)
+        for i, t in enumerate(range(d.n_times - 1, -1, -1)):
+            if (i + 1) % stride == 0 or t == 0:
+                x_t, x_0 = self.step(x_t, t, x_buffers[(i + 1) % 2], noise, return_x0=True, timesteps=timesteps)
+                yield t, d.reverse_scale_to_zero_to_one(x_t), d.reverse_scale_to_zero_to_one(x_0.clamp_(-1., 1))
+            else:
+                x_t = self.step(x_t, t, x_buffers[(i + 1) % 2], noise, timesteps=timesteps)
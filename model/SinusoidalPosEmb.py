@@ -7,12 +7,12 @@ class SinusoidalPosEmb(nn.Module):
     def __init__(self, dim):
         super().__init__()
         self.dim = dim
-
-    def forward(self, x):
-        device = x.device
         half_dim = self.dim // 2
         emb = math.log(10000) / (half_dim - 1)
-        emb = torch.exp(torch.arange(half_dim, device=device) * -emb)
-        emb = x[:, None] * emb[None, :]
+        # Built on the CPU even under a meta device context, since it is not part of the state_dict
+        self.register_buffer('freqs', torch.exp(torch.arange(half_dim, device='cpu') * -emb), persistent=False)
+
+    def forward(self, x):
+        emb = x[:, None] * self.freqs[None, :]
         emb = torch.cat((emb.sin(), emb.cos()), dim=-1)
         return emb
\ No newline at end of file
@@ -0,0 +1,150 @@
+"""
+Flat, memory-mapped checkpoint format for `Diffusion` (Denoiser weights + NoiseSchedule buffers).
+
+Layout: 8-byte magic, 8-byte little-endian header length, a JSON header mapping every tensor
+name to its dtype, shape and byte offset (plus `__metadata__` with the model config), then
+the raw tensor bytes, each aligned to 64 bytes. Loading maps the file and wraps each tensor
+around its slice of the mapping, so nothing is read or unpickled up front.
+
+    python -m model.checkpoint convert denoiser.pt denoiser.ckpt --hidden-dim 256 --n-layers 8 --dtype bf16
+"""
+import argparse
+import json
+import mmap
+import struct
+
+import torch
+
+MAGIC = b'DIFFCKPT'
+ALIGN = 64
+DTYPES = {'float64': torch.float64, 'float32': torch.float32, 'float16': torch.float16,
+          'bfloat16': torch.bfloat16, 'int64': torch.int64, 'int32': torch.int32, 'uint8': torch.uint8}
+
+
+def align(n):
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+
+def save_checkpoint(path, state_dict, metadata=None, weight_dtype=None):
+    # `weight_dtype` (e.g. torch.bfloat16) applies to floating tensors outside the noise schedule
+    tensors, entries, offset = [], {}, 0
+    for name, tensor in state_dict.items():
+        tensor = tensor.detach().cpu()
+        if weight_dtype is not None and tensor.is_floating_point() and not name.startswith('schedule.'):
+            tensor = tensor.to(weight_dtype)
+        tensor = tensor.contiguous()
+        nbytes = tensor.numel() * tensor.element_size()
+        entries[name] = {'dtype': str(tensor.dtype).removeprefix('torch.'), 'shape': list(tensor.shape),
+                         'offset': offset, 'nbytes': nbytes}
+        tensors.append(tensor)
+        offset = align(offset + nbytes)
+    header = json.dumps({'__metadata__': metadata or {}, 'tensors': entries}).encode()
+    header += b' ' * (align(len(MAGIC) + 8 + len(header)) - len(MAGIC) - 8 - len(header))
+    with open(path, 'wb') as f:
+        f.write(MAGIC + struct.pack('<Q', len(header)) + header)
+        start = f.tell()
+        for tensor, entry in zip(tensors, entries.values()):
+            f.seek(start + entry['offset'])
+            f.write(tensor.view(torch.uint8).reshape(-1).numpy().tobytes() if tensor.numel() else b'')
+        f.truncate(start + offset)
+
+
+def is_checkpoint(path):
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def load_checkpoint(path):
+    """ Returns (state_dict, metadata); tensors are copy-on-write views of the mapped file """
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a flat diffusion checkpoint")
+        header_len, = struct.unpack('<Q', f.read(8))
+        header = json.loads(f.read(header_len))
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+    start = len(MAGIC) + 8 + header_len
+    state_dict = {}
+    for name, entry in header['tensors'].items():
+        dtype = DTYPES[entry['dtype']]
+        count = entry['nbytes'] // torch.empty((), dtype=dtype).element_size()
+        tensor = torch.frombuffer(buffer, dtype=dtype, count=count, offset=start + entry['offset']) if count \
+            else torch.empty(0, dtype=dtype)
+        state_dict[name] = tensor.reshape(entry['shape'])
+    return state_dict, header['__metadata__']
+
+
+def save_diffusion(path, diffusion, weight_dtype=None):
+    from model.Diffusion import Diffusion
+
+    # A view such as RespacedDiffusion pairs its schedule with remapped Denoiser timesteps, which
+    # `load_diffusion` would not restore: save the underlying diffusion and respace after loading
+    if type(diffusion) is not Diffusion:
+        raise ValueError(f"only a plain Diffusion can be saved, got {type(diffusion).__name__}")
+    metadata = {'denoiser': diffusion.model.config, 'noiseless_steps': diffusion.schedule.noiseless_steps}
+    save_checkpoint(path, diffusion.state_dict(), metadata, weight_dtype)
+
+
+def load_diffusion(path, device='cpu', dtype=torch.float32):
+    """ Rebuilds a `Diffusion` in eval mode; float32 weights stay mapped, other storage dtypes are cast to `dtype` """
+    from model.Denoiser import Denoiser
+    from model.Diffusion import Diffusion
+    from model.NoiseSchedule import NoiseSchedule
+
+    state_dict, metadata = load_checkpoint(path)
+    config = metadata['denoiser']
+    model_state = {name.removeprefix('model.'): tensor.to(dtype) if tensor.is_floating_point() else tensor
+                   for name, tensor in state_dict.items() if name.startswith('model.')}
+    schedule_state = {name.removeprefix('schedule.'): tensor
+                      for name, tensor in state_dict.items() if name.startswith('schedule.')}
+    model = Denoiser.from_state_dict(model_state, **config)
+    schedule = NoiseSchedule(schedule=schedule_state['betas'], noiseless_steps=metadata['noiseless_steps'])
+    schedule.load_state_dict(schedule_state, assign=True)
+    diffusion = Diffusion(model, config['image_resolution'], device='cpu', schedule=schedule)
+    return diffusion.to(device).eval()
+
+
+def convert(args):
+    from model.Denoiser import Denoiser
+    from model.Diffusion import Diffusion
+    from model.NoiseSchedule import NoiseSchedule
+
+    model = Denoiser(args.img_size, hidden_dims=[args.hidden_dim] * args.n_layers,
+                     diffusion_time_embedding_dim=args.timestep_embedding_dim, n_times=args.n_timesteps)
+    diffusion = Diffusion(model, args.img_size, n_times=args.n_timesteps, beta_minmax=args.beta_minmax,
+                          device='cpu', schedule=args.schedule)
+    state_dict = torch.load(args.source, map_location='cpu')
+    if any(name.startswith('model.') for name in state_dict):
+        # A Diffusion state_dict; older ones hold only the Denoiser, the schedule then comes from the arguments
+        model.load_state_dict({name.removeprefix('model.'): tensor
+                               for name, tensor in state_dict.items() if name.startswith('model.')})
+        schedule_state = {name.removeprefix('schedule.'): tensor
+                          for name, tensor in state_dict.items() if name.startswith('schedule.')}
+        if schedule_state:
+            schedule = NoiseSchedule(schedule=schedule_state['betas'])
+            schedule.load_state_dict(schedule_state)
+            diffusion = Diffusion(model, args.img_size, device='cpu', schedule=schedule)
+    else:
+        model.load_state_dict(state_dict)
+    save_diffusion(args.target, diffusion, {'float32': None, 'fp16': torch.float16, 'bf16': torch.bfloat16}[args.dtype])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest='command', required=True)
+    parser_convert = commands.add_parser('convert', help='convert a torch.save state_dict (Denoiser or Diffusion)')
+    parser_convert.add_argument('source')
+    parser_convert.add_argument('target')
+    parser_convert.add_argument('--dtype', choices=['float32', 'fp16', 'bf16'], default='float32')
+    parser_convert.add_argument('--img-size', type=int, nargs=3, default=[28, 28, 1])
+    parser_convert.add_argument('--hidden-dim', type=int, default=256)
+    parser_convert.add_argument('--n-layers', type=int, default=8)
+    parser_convert.add_argument('--timestep-embedding-dim', type=int, default=256)
+    parser_convert.add_argument('--n-timesteps', type=int, default=1000)
+    parser_convert.add_argument('--beta-minmax', type=float, nargs=2, default=[1e-4, 2e-2])
+    parser_convert.add_argument('--schedule', default='linear')
+    args = parser.parse_args()
+    convert(args)
+
+
+if __name__ == '__main__':
+    main()
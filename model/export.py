@@ -0,0 +1,177 @@
+"""
+Ahead-of-time export of the reverse step for deployment.
+
+The TorchScript artifact is a frozen TorchScript module whose `forward(x_t, timestep, z)` returns x_{t-1}:
+the Denoiser graph with its weights folded in as constants, the reverse-update tables and the
+projected time-embedding table. The image shape and number of timesteps ride along as
+`diffusion.json`, so `serving/exported_runtime.py` can run the whole loop with only torch.
+The ONNX export holds only the Denoiser, x_t and timestep to epsilon with a dynamic batch,
+for `OnnxSampler` to drive the reverse loop through onnxruntime.
+
+    python -m model.export denoiser.ckpt denoiser.ts
+    python -m model.export denoiser.ckpt denoiser.onnx --format onnx
+"""
+import argparse
+import contextlib
+import io
+import json
+import warnings
+
+import torch
+import torch.nn as nn
+
+METADATA = 'diffusion.json'
+
+
+class ReverseStep(nn.Module):
+    def __init__(self, diffusion):
+        super(ReverseStep, self).__init__()
+        self.model = diffusion.model
+        schedule = diffusion.schedule
+        timestep_map = getattr(diffusion, 'timestep_map', torch.arange(diffusion.n_times, device=diffusion.device))
+        self.register_buffer('time_table', diffusion.model.time_table()[timestep_map].clone())
+        self.register_buffer('x_coefs', schedule.reverse_x_coefs.clone())
+        self.register_buffer('eps_coefs', schedule.reverse_eps_coefs.clone())
+        self.register_buffer('noise_coefs', schedule.reverse_noise_coefs.clone())
+
+    def forward(self, x_t, timestep, z):
+        epsilon_pred = self.model.denoise(x_t, self.time_table[timestep][..., None, None])
+        x_coef = self.x_coefs[timestep][:, None, None, None]
+        eps_coef = self.eps_coefs[timestep][:, None, None, None]
+        noise_coef = self.noise_coefs[timestep][:, None, None, None]
+        return (x_coef * x_t - eps_coef * epsilon_pred + noise_coef * z).clamp(-1., 1)
+
+
+class Epsilon(nn.Module):
+    def __init__(self, model):
+        super(Epsilon, self).__init__()
+        self.model = model
+        self.register_buffer('time_table', model.time_table().clone())
+
+    def forward(self, x_t, timestep):
+        return self.model.denoise(x_t, self.time_table[timestep][..., None, None])
+
+
+@contextlib.contextmanager
+def eval_mode(model):
+    # Exports trace the caller's Denoiser itself: switch it to eval mode only while tracing
+    training = {module: module.training for module in model.modules()}
+    try:
+        yield model.eval()
+    finally:
+        for module, mode in training.items():
+            module.training = mode
+
+
+def check_precision(diffusion):
+    # Both exports trace the Denoiser in fp32; autocast would not be baked into the artifact
+    if diffusion.precision != 'fp32':
+        raise ValueError(f"only fp32 diffusions can be exported, got {diffusion.precision}")
+
+
+def metadata(diffusion):
+    return {'image_resolution': [diffusion.img_H, diffusion.img_W, diffusion.img_C], 'n_times': diffusion.n_times}
+
+
+@torch.no_grad()
+def export_step(diffusion, path=None, batch_size=2, check=True, atol=1e-5):
+    """
+        Traces and freezes the reverse step, checks it (and its `optimize_for_inference` form)
+        against the eager `Diffusion.denoise_at_t` and saves it to `path` when given
+    """
+    d = diffusion
+    check_precision(d)
+    generator = torch.Generator().manual_seed(0)
+    shape = (batch_size, d.img_C, d.img_H, d.img_W)
+    x_t = torch.randn(shape, generator=generator).to(d.device)
+    z = torch.randn(shape, generator=generator).to(d.device)
+    timestep = torch.randint(0, d.n_times, (batch_size,), generator=generator).to(d.device)
+    with warnings.catch_warnings(), eval_mode(d.model):
+        # TorchScript is deprecated upstream but is still the format that loads without Python source
+        warnings.simplefilter('ignore', FutureWarning)
+        module = torch.jit.freeze(torch.jit.trace(ReverseStep(d).eval(), (x_t, timestep, z)))
+        artifact = io.BytesIO()
+        torch.jit.save(module, artifact, _extra_files={METADATA: json.dumps(metadata(d))})
+        if check:
+            # Check what the runtime sees: the reloaded module, and its `optimize_for_inference` form,
+            # which the runtime applies after loading since its prepacked weights cannot be serialized
+            artifact.seek(0)
+            check_parity(d, torch.jit.load(artifact), batch_size + 1, atol)
+            artifact.seek(0)
+            check_parity(d, torch.jit.optimize_for_inference(torch.jit.load(artifact)), batch_size + 1, atol)
+    if path is not None:
+        with open(path, 'wb') as f:
+            f.write(artifact.getvalue())
+    return module
+
+
+def check_parity(diffusion, module, batch_size, atol=1e-5):
+    # A batch size other than the traced one, mixing timesteps (t=0 included, where no noise is added)
+    d = diffusion
+    generator = torch.Generator().manual_seed(1)
+    shape = (batch_size, d.img_C, d.img_H, d.img_W)
+    x_t = torch.randn(shape, generator=generator).to(d.device)
+    z = torch.randn(shape, generator=generator).to(d.device)
+    timestep = torch.randint(0, d.n_times, (batch_size,), generator=generator).to(d.device)
+    timestep[0] = 0
+
+    class FixedNoise:
+        def randn(self, t, like):
+            return z
+
+    expected = d.denoise_at_t(x_t, timestep, noise=FixedNoise())
+    actual = module(x_t, timestep, z)
+    error = (actual - expected).abs().max().item()
+    if error > atol:
+        raise RuntimeError(f"exported step differs from the eager module by {error:.3g} (atol {atol:.3g})")
+    return error
+
+
+@torch.no_grad()
+def export_onnx(diffusion, path, batch_size=2, opset_version=None, check=True, atol=1e-4):
+    """ Exports the Denoiser to ONNX with a dynamic batch and checks onnxruntime against the eager module """
+    d = diffusion
+    check_precision(d)
+    generator = torch.Generator().manual_seed(0)
+    x_t = torch.randn((batch_size, d.img_C, d.img_H, d.img_W), generator=generator).to(d.device)
+    timestep = torch.randint(0, d.model.n_times, (batch_size,), generator=generator).to(d.device)
+    batch = torch.export.Dim('batch', min=1)
+    with eval_mode(d.model):
+        torch.onnx.export(Epsilon(d.model).eval(), (x_t, timestep), path, input_names=['x_t', 'timestep'],
+                          output_names=['epsilon'], dynamic_shapes=({0: batch}, {0: batch}),
+                          opset_version=opset_version, dynamo=True, external_data=False, verbose=False)
+    if check:
+        from model.OnnxSampler import OnnxSampler
+        check_onnx_parity(d, OnnxSampler(d, path), batch_size + 1, atol)
+
+
+def check_onnx_parity(diffusion, sampler, batch_size, atol=1e-4):
+    d = diffusion
+    generator = torch.Generator().manual_seed(1)
+    x_t = torch.randn((batch_size, d.img_C, d.img_H, d.img_W), generator=generator).to(d.device)
+    timestep = torch.randint(0, d.n_times, (batch_size,), generator=generator).to(d.device)
+    with torch.inference_mode():
+        expected = d.predict_epsilon(x_t, timestep)
+    error = (sampler.predict_epsilon(x_t, timestep) - expected).abs().max().item()
+    if error > atol:
+        raise RuntimeError(f"onnxruntime epsilon differs from the eager module by {error:.3g} (atol {atol:.3g})")
+    return error
+
+
+def main():
+    from model.checkpoint import load_diffusion
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument('source', help='flat checkpoint written by `model.checkpoint`')
+    parser.add_argument('target')
+    parser.add_argument('--format', choices=['torchscript', 'onnx'], default='torchscript')
+    args = parser.parse_args()
+    diffusion = load_diffusion(args.source, device='cpu')
+    if args.format == 'onnx':
+        export_onnx(diffusion, args.target)
+    else:
+        export_step(diffusion, args.target)
+
+
+if __name__ == '__main__':
+    main()
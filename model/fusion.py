@@ -0,0 +1,41 @@
+"""
+Inference-time rewrite of `Denoiser.convs` into `FusedConvBlock`s.
+
+    fuse_conv_blocks(diffusion.model)    # checks every fused block against its ConvBlock
+    diffusion.sample(64)
+    unfuse_conv_blocks(diffusion.model)  # back to the reference blocks, e.g. before training
+"""
+import torch
+from model.FusedConvBlock import FusedConvBlock
+
+
+@torch.inference_mode()
+def check_block_parity(block, fused, image_size, batch_size=2, atol=1e-4):
+    # The residual path, which is how `Denoiser.denoise` calls its convs
+    generator = torch.Generator().manual_seed(0)
+    x = torch.randn((batch_size, block.in_channels, *image_size), generator=generator).to(block.weight.device)
+    time_embedding = torch.randn((batch_size, block.in_channels, 1, 1), generator=generator).to(x.device)
+    error = (fused(x, time_embedding, residual=True) - block(x, time_embedding, residual=True)).abs().max().item()
+    if error > atol:
+        raise RuntimeError(f"fused block differs from the reference ConvBlock by {error:.3g} (atol {atol:.3g})")
+    return error
+
+
+def fuse_conv_blocks(model, check=True, atol=1e-4, **compile_kwargs):
+    """ Replaces every ConvBlock in `model.convs` with a FusedConvBlock sharing its weights """
+    image_size = model.config['image_resolution'][:2]
+    for i, block in enumerate(model.convs):
+        if isinstance(block, FusedConvBlock):
+            continue
+        fused = FusedConvBlock(block, **compile_kwargs)
+        if check:
+            check_block_parity(block, fused, image_size, atol=atol)
+        model.convs[i] = fused
+    return model
+
+
+def unfuse_conv_blocks(model):
+    for i, block in enumerate(model.convs):
+        if isinstance(block, FusedConvBlock):
+            model.convs[i] = block.block
+    return model
@@ -0,0 +1,22 @@
+import struct
+import zlib
+
+import torch
+
+
+def to_uint8(x):
+    # [0, 1] float images to uint8 on the CPU
+    return (x * 255).round().clamp(0, 255).to(torch.uint8).cpu()
+
+
+def encode_png(images):
+    # images: uint8 [n, C, H, W] with C in (1, 3), tiled left to right
+    n, C, H, W = images.shape
+    pixels = images.permute(2, 0, 3, 1).reshape(H, n * W * C).numpy()
+    raw = b''.join(b'\x00' + row.tobytes() for row in pixels)
+
+    def chunk(tag, data):
+        return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data))
+
+    header = struct.pack('>IIBBBBB', n * W, H, 8, 0 if C == 1 else 2, 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + chunk(b'IHDR', header) + chunk(b'IDAT', zlib.compress(raw)) + chunk(b'IEND', b'')
@@ -0,0 +1,44 @@
+"""
+Device-agnostic training loop for `Diffusion`.
+
+Mixed precision and memory format come from the diffusion itself (`precision`, `channels_last`),
+so the same loop runs fp32, bf16 autocast on CPU or fp16/bf16 autocast on GPU. A gradient scaler
+is only used for fp16, the one mode whose gradients can underflow.
+
+    diffusion = Diffusion(model, device='cpu', precision='bf16', channels_last=True)
+    train(diffusion, train_loader, torch.optim.Adam(model.parameters(), lr=5e-5), epochs=10)
+"""
+import time
+
+import torch
+import torch.nn as nn
+
+
+def train_step(diffusion, x, optimizer, scaler, loss_fn=nn.MSELoss()):
+    optimizer.zero_grad(set_to_none=True)
+    if diffusion.channels_last:
+        x = x.contiguous(memory_format=torch.channels_last)
+    _, epsilon, pred_epsilon = diffusion(x)
+    loss = loss_fn(pred_epsilon.float(), epsilon)
+    scaler.scale(loss).backward()
+    scaler.step(optimizer)
+    scaler.update()
+    return loss.detach()
+
+
+def train(diffusion, train_loader, optimizer, epochs, device=None, log=print):
+    """ Returns the average loss of every epoch """
+    device = diffusion.device if device is None else torch.device(device)
+    scaler = torch.amp.GradScaler(device.type, enabled=diffusion.precision == 'fp16')
+    diffusion.train()
+    epoch_losses = []
+    for epoch in range(epochs):
+        start = time.perf_counter()
+        total_loss = torch.zeros((), device=device)
+        for x, _ in train_loader:
+            total_loss += train_step(diffusion, x.to(device, non_blocking=True), optimizer, scaler)
+        epoch_losses.append(total_loss.item() / len(train_loader))
+        if log is not None:
+            log(f"Epoch [{epoch + 1}/{epochs}], Loss: {epoch_losses[-1]:.6f}, "
+                f"Time: {time.perf_counter() - start:.2f}s")
+    return epoch_losses
@@ -1,10 +1,13 @@
 import torch
-from torchvision.utils import make_grid
-import matplotlib.pyplot as plt
-import numpy as np
+
+
+# matplotlib, torchvision and numpy are imported inside the functions so that headless
+# sampling workers importing anything from `model` never load them
 
 
 def show_image(x, idx):
+    import matplotlib.pyplot as plt
+    import numpy as np
     fig = plt.figure()
     image_data = x[idx].transpose(0, 1).transpose(1, 2).detach().cpu().numpy()
     image_data = np.clip(image_data, 0, 1)
@@ -12,6 +15,9 @@ def show_image(x, idx):
 
 
 def draw_sample_image(x, postfix):
+    import matplotlib.pyplot as plt
+    import numpy as np
+    from torchvision.utils import make_grid
     plt.figure(figsize=(8, 8))
     plt.axis("off")
     plt.title(f"Visualization of {postfix}")
@@ -19,6 +25,7 @@ def draw_sample_image(x, postfix):
 
 
 def visualise_forward_process_by_t(diffusion, x, num_timesteps_to_show):
+    import matplotlib.pyplot as plt
     x = diffusion.scale_to_minus_one_to_one(x)
     timesteps = torch.linspace(0, diffusion.n_times - 1, steps=num_timesteps_to_show).long().to(diffusion.device)
     fig, axs = plt.subplots(1, num_timesteps_to_show, figsize=(20, 4))
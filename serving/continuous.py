@@ -0,0 +1,127 @@
+"""
+Continuous batching across timesteps for the sampling server.
+
+Every forward pass runs `Diffusion.denoise_at_t` over a slot buffer in which each sample
+sits at its own timestep. New samples join at t = T - 1 as soon as a slot frees up and
+leave after t = 0, so the batch stays full instead of waiting for a whole batch to finish
+its reverse chain. Only ancestral DDPM (optionally respaced) is served.
+
+    python -m serving.continuous --checkpoint denoiser.pt --port 8000 --max-batch-size 64 --steps 250
+"""
+import argparse
+import asyncio
+from collections import deque
+
+import torch
+
+from model.RespacedDiffusion import RespacedDiffusion
+from model.SampleNoise import SampleNoise
+from model.image_io import to_uint8
+from serving.server import SamplingServer, SampleRequest, add_model_arguments, build_diffusion
+
+
+class ContinuousBatchingServer(SamplingServer):
+    def __init__(self, diffusion, max_batch_size=64):
+        super(ContinuousBatchingServer, self).__init__(diffusion, max_batch_size, max_wait_ms=0.)
+        d = diffusion
+        self.x = torch.empty((max_batch_size, d.img_C, d.img_H, d.img_W), device=d.device)
+        self.t = torch.empty((max_batch_size,), dtype=torch.long, device=d.device)
+        self.seeds = torch.empty((max_batch_size,), dtype=torch.long, device=d.device)
+        self.sample_ids = torch.empty((max_batch_size,), dtype=torch.long, device=d.device)
+        self.owners = []
+        self.waiting = deque()
+
+    async def submit(self, n=1, seed=None, sampler='ddpm', steps=None, eta=0.):
+        request = SampleRequest(n, seed, sampler, steps, eta)
+        if sampler != 'ddpm' or steps not in (None, self.diffusion.n_times):
+            raise ValueError(f"continuous batching serves ddpm with {self.diffusion.n_times} steps only")
+        d = self.diffusion
+        request.images = torch.empty((n, d.img_C, d.img_H, d.img_W), dtype=torch.uint8)
+        request.remaining = n
+        await self.queue.put(request)
+        return await request.future
+
+    def admit(self):
+        # Fill free slots from the waiting requests; large requests are admitted piecewise. Slots
+        # past `owners` are scratch until extended, so a request that fails here fails on its own
+        while self.waiting and len(self.owners) < self.max_batch_size:
+            request, start = self.waiting.popleft()
+            if request.future.done():
+                continue
+            count = min(request.n - start, self.max_batch_size - len(self.owners))
+            slots = slice(len(self.owners), len(self.owners) + count)
+            try:
+                self.seeds[slots] = request.seed
+                self.sample_ids[slots] = torch.arange(start, start + count)
+                self.x[slots] = SampleNoise(self.seeds[slots], self.sample_ids[slots]).initial(self.x[slots])
+                self.t[slots] = self.diffusion.n_times - 1
+            except Exception as e:
+                request.future.set_exception(e)
+                continue
+            self.owners.extend((request, i) for i in range(start, start + count))
+            if start + count < request.n:
+                self.waiting.appendleft((request, start + count))
+
+    @torch.inference_mode()
+    def step(self):
+        n = len(self.owners)
+        x, t = self.x[:n], self.t[:n]
+        self.diffusion.denoise_at_t(x, t, out=x, noise=SampleNoise(self.seeds[:n], self.sample_ids[:n]))
+        finished = t == 0
+        done = finished.nonzero().flatten().tolist()
+        results = []
+        if done:
+            images = to_uint8(self.diffusion.reverse_scale_to_zero_to_one(x[finished]))
+            results = [(*self.owners[i], image) for i, image in zip(done, images)]
+            keep = ~finished
+            kept = int(keep.sum())
+            self.x[:kept] = x[keep]
+            self.t[:kept] = t[keep]
+            self.seeds[:kept] = self.seeds[:n][keep]
+            self.sample_ids[:kept] = self.sample_ids[:n][keep]
+            done = set(done)
+            self.owners = [owner for i, owner in enumerate(self.owners) if i not in done]
+        self.t[:len(self.owners)] -= 1
+        return results
+
+    async def batch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            if not self.owners and not self.waiting:
+                self.waiting.append((await self.queue.get(), 0))
+            while not self.queue.empty():
+                self.waiting.append((self.queue.get_nowait(), 0))
+            try:
+                self.admit()
+                results = await loop.run_in_executor(self.executor, self.step)
+            except Exception as e:
+                for request in {owner[0] for owner in self.owners} | {w[0] for w in self.waiting}:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+                self.owners, self.waiting = [], deque()
+                continue
+            for request, index, image in results:
+                request.images[index] = image
+                request.remaining -= 1
+                if request.remaining == 0 and not request.future.done():
+                    request.future.set_result(request.images)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    add_model_arguments(parser)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--unix', help='serve on a unix socket instead of TCP')
+    parser.add_argument('--max-batch-size', type=int, default=64)
+    parser.add_argument('--steps', type=int, help='respace the reverse chain to this many steps')
+    args = parser.parse_args()
+    diffusion = build_diffusion(args)
+    if args.steps is not None:
+        diffusion = RespacedDiffusion(diffusion, args.steps)
+    server = ContinuousBatchingServer(diffusion, args.max_batch_size)
+    asyncio.run(server.serve(args.host, args.port, args.unix))
+
+
+if __name__ == '__main__':
+    main()
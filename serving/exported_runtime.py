@@ -0,0 +1,69 @@
+"""
+Standalone DDPM sampling over an artifact written by `model.export`.
+
+Only torch is imported: the Denoiser, the schedule tables and the time-embedding table all
+live inside the frozen TorchScript module, so this file can ship without the `model` package.
+Noise comes from a `torch.Generator`, so seeded samples are reproducible across runs of the
+runtime but do not match the per-sample counter noise of `Diffusion.sample`.
+
+    python -m serving.exported_runtime denoiser.ts --n 16 --seed 0 --output samples.pt
+"""
+import argparse
+import json
+import time
+import warnings
+
+import torch
+
+METADATA = 'diffusion.json'
+
+
+class ExportedSampler:
+    def __init__(self, path, device='cpu', optimize=False):
+        extra_files = {METADATA: ''}
+        with warnings.catch_warnings():
+            warnings.simplefilter('ignore', FutureWarning)
+            self.step = torch.jit.load(path, map_location=device, _extra_files=extra_files)
+            if optimize:
+                self.step = torch.jit.optimize_for_inference(self.step)
+        metadata = json.loads(extra_files[METADATA])
+        self.img_H, self.img_W, self.img_C = metadata['image_resolution']
+        self.n_times = metadata['n_times']
+        self.device = torch.device(device)
+
+    @torch.inference_mode()
+    def sample(self, N, x_T=None, seed=None):
+        shape = (N, self.img_C, self.img_H, self.img_W)
+        generator = torch.Generator(self.device)
+        if seed is None:
+            generator.seed()
+        else:
+            generator.manual_seed(seed)
+        x_t = torch.randn(shape, generator=generator, device=self.device) if x_T is None else x_T.to(self.device)
+        z = torch.empty(shape, device=self.device)
+        timesteps = torch.arange(self.n_times, device=self.device).unsqueeze(1).expand(-1, N)
+        for t in range(self.n_times - 1, -1, -1):
+            torch.randn(shape, generator=generator, out=z)
+            x_t = self.step(x_t, timesteps[t], z)
+        return (x_t + 1) * 0.5
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('artifact')
+    parser.add_argument('--n', type=int, default=16)
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--device', default='cpu')
+    parser.add_argument('--optimize', action='store_true', help='apply `torch.jit.optimize_for_inference` on load')
+    parser.add_argument('--output', help='torch.save the [N, C, H, W] samples in [0, 1]')
+    args = parser.parse_args()
+    start = time.perf_counter()
+    sampler = ExportedSampler(args.artifact, args.device, args.optimize)
+    samples = sampler.sample(args.n, seed=args.seed)
+    print(f"{args.n} samples in {time.perf_counter() - start:.2f}s")
+    if args.output is not None:
+        torch.save(samples, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Load-test client for `serving.server`.
+
+Keeps `--concurrency` requests in flight until `--requests` have completed and reports
+throughput and latency percentiles.
+
+    python -m serving.load_test --port 8000 --requests 200 --concurrency 32 --sampler ddim --steps 20
+"""
+import argparse
+import asyncio
+import json
+import time
+
+
+async def request(args, payload):
+    if args.unix:
+        reader, writer = await asyncio.open_unix_connection(args.unix)
+    else:
+        reader, writer = await asyncio.open_connection(args.host, args.port)
+    body = json.dumps(payload).encode()
+    writer.write(f"POST /sample HTTP/1.1\r\nHost: {args.host}\r\nContent-Length: {len(body)}\r\n\r\n".encode() + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    response = await reader.read()
+    writer.close()
+    if status != 200:
+        message = response.split(b'\r\n\r\n', 1)[-1].decode(errors='replace')
+        raise RuntimeError(f"HTTP {status}: {message}")
+
+
+async def worker(args, next_id, latencies):
+    while (i := next(next_id, None)) is not None:
+        payload = {'n': args.n, 'seed': i, 'sampler': args.sampler, 'format': args.format}
+        if args.steps is not None:
+            payload['steps'] = args.steps
+        start = time.perf_counter()
+        await request(args, payload)
+        latencies.append(time.perf_counter() - start)
+
+
+async def run(args):
+    next_id, latencies = iter(range(args.requests)), []
+    start = time.perf_counter()
+    await asyncio.gather(*(worker(args, next_id, latencies) for _ in range(args.concurrency)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+
+    def percentile(q):
+        return latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000
+
+    print(f"{args.requests} requests x {args.n} images in {elapsed:.2f}s: "
+          f"{args.requests / elapsed:.1f} req/s, {args.requests * args.n / elapsed:.1f} images/s")
+    print(f"latency ms: p50 {percentile(0.5):.1f}  p90 {percentile(0.9):.1f}  p99 {percentile(0.99):.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--unix')
+    parser.add_argument('--requests', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--n', type=int, default=1)
+    parser.add_argument('--sampler', default='ddim')
+    parser.add_argument('--steps', type=int)
+    parser.add_argument('--format', default='raw')
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""
+Multi-process CPU sampling backend.
+
+N is split into contiguous shards of sample ids, one per worker process. Each worker is
+pinned to its own disjoint set of cores, runs `threads_per_worker` intra-op threads and
+builds the Denoiser from the checkpoint once, in the pool initializer, or attaches to
+weights shared by the parent (`ProcessPoolSampler.from_diffusion`). Shards come back
+in order, and sample i draws its noise from the counter keyed by (seed, i), so the output
+does not depend on the number of workers.
+
+Workers are never recycled (`maxtasksperchild=None`). Each one takes its core set once, from
+a queue filled when the pool starts. A worker started later to replace one that died finds the
+queue empty and spreads over all of the pool's cores instead of waiting for a set.
+"""
+import argparse
+import os
+import queue
+
+import torch
+import torch.multiprocessing as mp
+
+from serving.server import build_diffusion, make_sampler
+from serving.shared_weights import attach_diffusion, share_diffusion
+
+_worker = {}
+
+
+def core_sets(n_workers, cores=None):
+    cores = sorted(os.sched_getaffinity(0)) if cores is None else list(cores)
+    if n_workers > len(cores):
+        raise ValueError(f"{n_workers} workers need at least as many cores, got {len(cores)}")
+    per_worker = len(cores) // n_workers
+    return [cores[i * per_worker:(i + 1) * per_worker] for i in range(n_workers)]
+
+
+def pin_worker(pool_cores, core_queue, threads_per_worker):
+    try:
+        cores = core_queue.get(timeout=1.)
+    except queue.Empty:
+        cores = pool_cores
+    os.sched_setaffinity(0, cores)
+    torch.set_num_threads(threads_per_worker or len(cores))
+    torch.set_num_interop_threads(1)
+
+
+def init_worker(pool_cores, core_queue, model_args, sampler_args, threads_per_worker):
+    pin_worker(pool_cores, core_queue, threads_per_worker)
+    # Same weights in every worker even without a checkpoint
+    torch.manual_seed(0)
+    diffusion = build_diffusion(model_args)
+    _worker['sampler'] = make_sampler(diffusion, *sampler_args)
+
+
+def init_shared_worker(pool_cores, core_queue, diffusion, sampler_args, threads_per_worker):
+    pin_worker(pool_cores, core_queue, threads_per_worker)
+    _worker['sampler'] = make_sampler(attach_diffusion(diffusion), *sampler_args)
+
+
+def sample_shard(shard):
+    start, stop, seed = shard
+    return _worker['sampler'].sample(stop - start, seed=seed, sample_ids=torch.arange(start, stop)).cpu()
+
+
+class ProcessPoolSampler:
+    """
+        Shards `sample(N)` across pinned worker processes
+            Args:
+                model_args: namespace accepted by `serving.server.build_diffusion` (checkpoint, sizes, schedule)
+                sampler_args: (sampler, steps, eta) as in `serving.server.make_sampler`
+                threads_per_worker: intra-op threads per worker, defaults to its number of cores
+    """
+
+    def __init__(self, model_args, n_workers, sampler_args=('ddpm', None, 0.), threads_per_worker=None, cores=None,
+                 start_method='spawn', diffusion=None):
+        self.n_workers = n_workers
+        ctx = mp.get_context(start_method)
+        if start_method == 'forkserver':
+            ctx.set_forkserver_preload(['serving.process_pool'])
+        worker_core_sets = core_sets(n_workers, cores)
+        core_queue = ctx.Queue()
+        for worker_cores in worker_core_sets:
+            core_queue.put(worker_cores)
+        pool_cores = sorted(set().union(*worker_core_sets))
+        if diffusion is not None:
+            initializer = init_shared_worker
+            initargs = (pool_cores, core_queue, diffusion, sampler_args, threads_per_worker)
+        else:
+            # A copy, so the caller's namespace keeps its device
+            model_args = argparse.Namespace(**{**vars(model_args), 'device': 'cpu'})
+            initializer = init_worker
+            initargs = (pool_cores, core_queue, model_args, sampler_args, threads_per_worker)
+        self.pool = ctx.Pool(n_workers, initializer=initializer, initargs=initargs, maxtasksperchild=None)
+
+    @classmethod
+    def from_diffusion(cls, diffusion, n_workers, sampler_args=('ddpm', None, 0.), threads_per_worker=None, cores=None):
+        # Workers are forked from a preloaded server and attach to a shared-memory copy of the weights;
+        # the caller's diffusion is not modified
+        return cls(None, n_workers, sampler_args, threads_per_worker, cores, start_method='forkserver',
+                   diffusion=share_diffusion(diffusion))
+
+    def sample(self, N, seed=0):
+        bounds = [N * i // self.n_workers for i in range(self.n_workers + 1)]
+        shards = [(start, stop, seed) for start, stop in zip(bounds, bounds[1:]) if stop > start]
+        return torch.cat(self.pool.map(sample_shard, shards))
+
+    def close(self):
+        self.pool.close()
+        self.pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,260 @@
+"""
+Asyncio micro-batching sampling server.
+
+Concurrent requests that ask for the same sampler settings are coalesced into one
+`sample(N)` call, bounded by `max_batch_size` images and a `max_wait_ms` window.
+Each sample draws its noise from a counter keyed by (request seed, index in request), so
+a seed returns the same images whatever batch it lands in.
+
+    python -m serving.server --checkpoint denoiser.pt --port 8000
+    curl -X POST localhost:8000/sample -d '{"n": 4, "seed": 1, "sampler": "ddim", "steps": 50}' > out.png
+
+Request body (JSON): n, seed, sampler ('ddpm', 'ddim', 'dpm'), steps, eta, format ('png', 'raw').
+Raw responses are uint8 [n, C, H, W] bytes with the shape in the X-Shape header.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import torch
+
+from model.DDIMSampler import DDIMSampler
+from model.DPMSolverSampler import DPMSolverSampler
+from model.Denoiser import Denoiser
+from model.Diffusion import Diffusion
+from model.RespacedDiffusion import RespacedDiffusion
+from model.checkpoint import is_checkpoint, load_diffusion
+from model.image_io import encode_png, to_uint8
+
+SAMPLERS = ('ddpm', 'ddim', 'dpm')
+HTTP_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed',
+                500: 'Internal Server Error'}
+MAX_SEED = 2 ** 63
+MAX_N = 1024
+MAX_SAMPLERS = 16
+
+
+def make_sampler(diffusion, sampler='ddpm', steps=None, eta=0.):
+    # Anything with `sample(N, x_T=None, seed=None, sample_ids=None)`
+    if sampler == 'ddpm':
+        return diffusion if steps in (None, diffusion.n_times) else RespacedDiffusion(diffusion, steps)
+    if sampler == 'ddim':
+        return DDIMSampler(diffusion, steps if steps is not None else 50, eta)
+    if sampler == 'dpm':
+        return DPMSolverSampler(diffusion, steps if steps is not None else 20)
+    raise ValueError(f"sampler must be one of {SAMPLERS}, got {sampler!r}")
+
+
+def is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)
+
+
+class SampleRequest:
+    def __init__(self, n, seed, sampler, steps, eta):
+        if sampler not in SAMPLERS:
+            raise ValueError(f"sampler must be one of {SAMPLERS}, got {sampler!r}")
+        if not is_int(n) or not 1 <= n <= MAX_N:
+            # Every image of a request is held until the last one is done
+            raise ValueError(f"n must be an integer in [1, {MAX_N}], got {n!r}")
+        if seed is not None and not (is_int(seed) and 0 <= seed < MAX_SEED):
+            raise ValueError(f"seed must be an integer in [0, 2**63), got {seed!r}")
+        if steps is not None and not (is_int(steps) and steps >= 1):
+            raise ValueError(f"steps must be a positive integer, got {steps!r}")
+        if not isinstance(eta, (int, float)) or isinstance(eta, bool):
+            raise ValueError(f"eta must be a number, got {eta!r}")
+        self.n = n
+        self.seed = random.getrandbits(63) if seed is None else seed
+        self.key = (sampler, steps, float(eta))
+        self.parts = {}
+        self.future = asyncio.get_running_loop().create_future()
+
+    def add_part(self, start, images):
+        # Returns the whole [n, C, H, W] result once every part of the request has arrived
+        self.parts[start] = images
+        if sum(len(part) for part in self.parts.values()) < self.n:
+            return None
+        return torch.cat([self.parts[start] for start in sorted(self.parts)])
+
+
+class SamplingServer:
+    def __init__(self, diffusion, max_batch_size=64, max_wait_ms=10.):
+        self.diffusion = diffusion
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.samplers = OrderedDict()
+        self.queue = None
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    def get_sampler(self, key):
+        # Keyed by client-chosen settings, so only the most recently used ones are kept. Only
+        # called from the event loop, never from the executor thread
+        if key in self.samplers:
+            self.samplers.move_to_end(key)
+        else:
+            self.samplers[key] = make_sampler(self.diffusion, *key).sample
+            if len(self.samplers) > MAX_SAMPLERS:
+                self.samplers.popitem(last=False)
+        return self.samplers[key]
+
+    def run_batch(self, sample, parts):
+        # `parts` are (request, start, count): samples start..start+count-1 of a request
+        seeds = torch.cat([torch.full((count,), r.seed) for r, _, count in parts])
+        sample_ids = torch.cat([torch.arange(start, start + count) for _, start, count in parts])
+        images = sample(len(seeds), seed=seeds, sample_ids=sample_ids)
+        return to_uint8(images).split([count for _, _, count in parts])
+
+    async def submit(self, n=1, seed=None, sampler='ddpm', steps=None, eta=0.):
+        request = SampleRequest(n, seed, sampler, steps, eta)
+        # Invalid sampler settings fail here, for this request only, rather than in a shared batch
+        self.get_sampler(request.key)
+        await self.queue.put(request)
+        return await request.future
+
+    async def collect(self):
+        pending = [await self.queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while sum(r.n for r in pending) < self.max_batch_size:
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                pending.append(await asyncio.wait_for(self.queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return pending
+
+    def pack(self, pending):
+        # Group by sampler settings, then fill batches of at most `max_batch_size` images,
+        # splitting requests that do not fit
+        groups = {}
+        for request in pending:
+            groups.setdefault(request.key, []).append(request)
+        for key, requests in groups.items():
+            batch, size = [], 0
+            for request in requests:
+                start = 0
+                while start < request.n:
+                    count = min(request.n - start, self.max_batch_size - size)
+                    batch.append((request, start, count))
+                    size += count
+                    start += count
+                    if size == self.max_batch_size:
+                        yield key, batch
+                        batch, size = [], 0
+            if batch:
+                yield key, batch
+
+    async def batch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            pending = await self.collect()
+            for key, batch in self.pack(pending):
+                try:
+                    results = await loop.run_in_executor(self.executor, self.run_batch, self.get_sampler(key), batch)
+                except Exception as e:
+                    results = [e] * len(batch)
+                for (request, start, _), result in zip(batch, results):
+                    if request.future.done():
+                        continue
+                    if isinstance(result, Exception):
+                        request.future.set_exception(result)
+                    elif (images := request.add_part(start, result)) is not None:
+                        request.future.set_result(images)
+
+    async def handle(self, reader, writer):
+        try:
+            status, headers, body = await self.respond(reader)
+        except (ValueError, KeyError, TypeError) as e:
+            status, headers, body = 400, {'Content-Type': 'application/json'}, json.dumps({'error': str(e)}).encode()
+        except Exception as e:
+            status, headers, body = 500, {'Content-Type': 'application/json'}, json.dumps({'error': repr(e)}).encode()
+        head = f"HTTP/1.1 {status} {HTTP_REASONS[status]}\r\nContent-Length: {len(body)}\r\nConnection: close\r\n"
+        head += ''.join(f"{k}: {v}\r\n" for k, v in headers.items())
+        writer.write(head.encode() + b'\r\n' + body)
+        await writer.drain()
+        writer.close()
+
+    async def respond(self, reader):
+        method, path, _ = (await reader.readline()).decode().split(' ', 2)
+        length = 0
+        while (line := await reader.readline()) not in (b'\r\n', b'\n', b''):
+            name, _, value = line.decode().partition(':')
+            if name.strip().lower() == 'content-length':
+                length = int(value)
+        if path.split('?')[0] != '/sample':
+            return 404, {}, b''
+        if method != 'POST':
+            return 405, {}, b''
+        params = json.loads(await reader.readexactly(length)) if length else {}
+        fmt = params.pop('format', 'png')
+        if fmt not in ('png', 'raw'):
+            raise ValueError(f"format must be 'png' or 'raw', got {fmt!r}")
+        if params.get('seed') is None:
+            params['seed'] = random.getrandbits(63)
+        seed = params['seed']
+        images = await self.submit(**params)
+        headers = {'X-Seed': seed, 'X-Shape': ','.join(map(str, images.shape))}
+        if fmt == 'png':
+            return 200, {'Content-Type': 'image/png', **headers}, encode_png(images)
+        return 200, {'Content-Type': 'application/octet-stream', **headers}, images.numpy().tobytes()
+
+    async def serve(self, host='127.0.0.1', port=8000, unix_path=None):
+        self.queue = asyncio.Queue()
+        batcher = asyncio.create_task(self.batch_loop())
+        if unix_path is not None:
+            server = await asyncio.start_unix_server(self.handle, path=unix_path)
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            batcher.cancel()
+
+
+def build_diffusion(args):
+    if args.checkpoint is not None and is_checkpoint(args.checkpoint):
+        return load_diffusion(args.checkpoint, args.device).eval()
+    config = dict(image_resolution=args.img_size, hidden_dims=[args.hidden_dim] * args.n_layers,
+                  diffusion_time_embedding_dim=args.timestep_embedding_dim, n_times=args.n_timesteps)
+    if args.checkpoint is not None:
+        model = Denoiser.from_state_dict(torch.load(args.checkpoint, map_location='cpu', mmap=True), **config)
+    else:
+        model = Denoiser(**config)
+    diffusion = Diffusion(model.to(args.device), image_resolution=args.img_size, n_times=args.n_timesteps,
+                          beta_minmax=args.beta_minmax, device=args.device, schedule=args.schedule)
+    return diffusion.eval()
+
+
+def add_model_arguments(parser):
+    parser.add_argument('--checkpoint', help='Denoiser state_dict saved with torch.save, or a flat .ckpt '
+                                             '(model sizes and schedule are then read from the file)')
+    parser.add_argument('--img-size', type=int, nargs=3, default=[28, 28, 1])
+    parser.add_argument('--hidden-dim', type=int, default=256)
+    parser.add_argument('--n-layers', type=int, default=8)
+    parser.add_argument('--timestep-embedding-dim', type=int, default=256)
+    parser.add_argument('--n-timesteps', type=int, default=1000)
+    parser.add_argument('--beta-minmax', type=float, nargs=2, default=[1e-4, 2e-2])
+    parser.add_argument('--schedule', default='linear')
+    parser.add_argument('--device', default='cuda' if torch.cuda.is_available() else 'cpu')
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    add_model_arguments(parser)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--unix', help='serve on a unix socket instead of TCP')
+    parser.add_argument('--max-batch-size', type=int, default=64)
+    parser.add_argument('--max-wait-ms', type=float, default=10.)
+    args = parser.parse_args()
+    server = SamplingServer(build_diffusion(args), args.max_batch_size, args.max_wait_ms)
+    asyncio.run(server.serve(args.host, args.port, args.unix))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,33 @@
+"""
+Shared-memory weights for sampling workers.
+
+`share_diffusion` copies the Denoiser parameters, the NoiseSchedule buffers and the cached
+time-embedding table into one set of shared-memory segments. Pickling the diffusion to a
+worker then sends segment handles instead of tensor bytes, so workers attach zero-copy
+and resident memory stays at one copy of the weights however many workers run.
+"""
+import copy
+
+import torch
+
+
+def share_diffusion(diffusion):
+    """ Returns a CPU, eval-mode, frozen copy of `diffusion` in shared memory; `diffusion` is left as is """
+    diffusion = copy.deepcopy(diffusion).cpu()
+    diffusion.engine.release()
+    model = diffusion.model.eval()
+    # Every worker maps the same pages: nothing may train or update them in place
+    model.requires_grad_(False)
+    with torch.no_grad():
+        model.time_table()
+    diffusion.share_memory()
+    model._time_table.share_memory_()
+    return diffusion
+
+
+def attach_diffusion(diffusion):
+    # Worker side: parameter addresses differ per process, so re-key the shared time table
+    model = diffusion.model
+    if model._time_table is not None:
+        model._time_table_key = model.time_table_key()
+    return diffusion